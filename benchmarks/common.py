@@ -0,0 +1,197 @@
+"""
+Helpers shared by the benchmark scripts.
+
+The benchmarks run headless: child processes get an offscreen Qt platform
+(QT_QPA_PLATFORM=offscreen). PySide 1.x is built on Qt 4, which has no
+offscreen platform on X11, so pass --xvfb to run the children under xvfb-run.
+"""
+import os
+import sys
+import json
+import time
+import subprocess
+import importlib
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+
+def headless_env(extra=None):
+    env = dict(os.environ)
+    env.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    # Make sure the children import this checkout of the module
+    env['PYTHONPATH'] = os.pathsep.join(p for p in (ROOT, env.get('PYTHONPATH')) if p)
+    if extra:
+        env.update(extra)
+    return env
+
+def load_launcher(spec=None):
+    """
+    The Coinbox launcher, given as module:function or found among the
+    installed console scripts.
+    """
+    if spec:
+        module_name, _, func_name = spec.partition(':')
+        return getattr(importlib.import_module(module_name), func_name)
+    import pkg_resources
+    for entry_point in pkg_resources.iter_entry_points('console_scripts', 'coinbox'):
+        return entry_point.load()
+    raise RuntimeError('Coinbox launcher not found, pass it with --launcher module:function')
+
+def run_in_coinbox(entry, callback, launcher=None):
+    """
+    Launch Coinbox with an entry point and call callback() on the first turn
+    of the event loop, once the entry point has chained its window.
+    The application quits when the callback returns.
+    """
+    from pydispatch import dispatcher
+
+    def run():
+        from PySide import QtGui
+        try:
+            callback()
+        finally:
+            QtGui.QApplication.instance().quit()
+
+    def on_post_init():
+        from PySide import QtCore
+        QtCore.QTimer.singleShot(0, run)
+
+    dispatcher.connect(on_post_init, signal='ui-post-init', sender=dispatcher.Any, weak=False)
+
+    sys.argv = ['coinbox', entry]
+    try:
+        load_launcher(launcher)()
+    except SystemExit:
+        pass
+
+def run_child(args, env=None, xvfb=False, timeout=120):
+    """
+    Run a child python process and return (returncode, wall time).
+    """
+    command = [sys.executable] + list(args)
+    if xvfb:
+        command = ['xvfb-run', '-a'] + command
+    start = time.time()
+    process = subprocess.Popen(command, env=env)
+    while process.poll() is None:
+        if time.time() - start > timeout:
+            process.kill()
+            process.wait()
+            raise RuntimeError('Timed out after {}s: {}'.format(timeout, ' '.join(command)))
+        time.sleep(0.01)
+    return process.returncode, time.time() - start
+
+def median(values):
+    values = sorted(values)
+    if not values:
+        return None
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2.0
+
+def load_json(filename, default=None):
+    if not os.path.exists(filename):
+        return default
+    with open(filename, 'rb') as f:
+        return json.loads(f.read().decode('utf-8'))
+
+def dump_json(data, filename=None):
+    text = json.dumps(data, indent=2, sort_keys=True)
+    if filename is None:
+        sys.stdout.write(text + '\n')
+    else:
+        with open(filename, 'wb') as f:
+            f.write(text.encode('utf-8'))
+
+class ImportTimer(object):
+    """
+    Times the first import of every module by wrapping __import__.
+
+    For each module it records the cumulative time, the self time (without
+    the modules it imported) and the module that triggered the import.
+    """
+
+    def __init__(self):
+        try:
+            import __builtin__ as builtins
+        except ImportError:
+            import builtins
+        self.builtins = builtins
+        self.original = builtins.__import__
+        self.stack = []
+        self.modules = {}
+
+    def install(self):
+        self.builtins.__import__ = self.__import
+
+    def uninstall(self):
+        self.builtins.__import__ = self.original
+
+    def __import(self, name, *args, **kwargs):
+        before = set(sys.modules)
+        globals = args[0] if args else kwargs.get('globals')
+        importer = (globals or {}).get('__name__')
+        self.stack.append([0.0])
+        start = time.time()
+        try:
+            return self.original(name, *args, **kwargs)
+        finally:
+            elapsed = time.time() - start
+            children = self.stack.pop()[0]
+            if self.stack:
+                self.stack[-1][0] += elapsed
+            new = [m for m in set(sys.modules) - before if sys.modules[m] is not None]
+            if new:
+                # Attribute the time to the module asked for, or to the
+                # deepest module newly imported for relative imports
+                named = [m for m in new if m == name or m.endswith('.' + name)]
+                module = max(named or new, key=lambda m: m.count('.'))
+                self.modules[module] = {
+                    'cumulative': elapsed,
+                    'self': max(elapsed - children, 0.0),
+                    'importer': importer,
+                }
+                for other in new:
+                    self.modules.setdefault(other, {
+                        'cumulative': 0.0,
+                        'self': 0.0,
+                        'importer': importer,
+                    })
+
+    def imported_by(self, prefix):
+        """
+        Names of the modules whose import chain starts in a module under prefix.
+        """
+        result = set()
+        for name in self.modules:
+            importer = self.modules[name]['importer']
+            seen = set()
+            while importer is not None and importer not in seen:
+                if importer == prefix or importer.startswith(prefix + '.'):
+                    result.add(name)
+                    break
+                seen.add(importer)
+                importer = self.modules.get(importer, {}).get('importer')
+        return sorted(result)
+
+def check_budget(measured, budget, path=()):
+    """
+    Compare nested dicts of measured numbers with nested dicts of limits.
+    Returns the list of (key path, measured, limit) that exceed the budget.
+    """
+    failures = []
+    for key, limit in budget.items():
+        if key not in measured:
+            continue
+        value = measured[key]
+        if isinstance(limit, dict):
+            failures.extend(check_budget(value, limit, path + (key,)))
+        elif isinstance(limit, list):
+            # A list of forbidden names
+            for name in value:
+                if any(name == f or name.startswith(f + '.') for f in limit):
+                    failures.append(('.'.join(path + (key,)), name, limit))
+        elif value is not None and value > limit:
+            failures.append(('.'.join(path + (key,)), value, limit))
+    return failures
@@ -0,0 +1,307 @@
+"""
+Benchmarks of the configuration editors and of the database setup worker
+at production scale.
+
+Every case runs in its own headless Coinbox process (raw-config entry
+point, with a throwaway HOME) so that its peak memory is measured alone:
+
+    main_config_populate:N     MainConfigPage.populate with N module pages
+    main_config_ok:N           MainConfigPage.onOkButton with N module pages
+    raw_config_dialog:N        RawConfigDialog on a config of N options
+    section_tab_save:N         SectionTab.save of a section of N options
+    setup_worker               every DatabaseSetupWorker phase on a SQLite file
+
+The editor cases run on a synthetic config written to disk. The results
+(wall time in seconds, peak RSS in KiB) are printed as JSON and compared
+with a stored baseline:
+
+    python benchmarks/editors.py [--case NAME] [--baseline FILE] [--save-baseline]
+
+Exits with status 1 when a case is slower or bigger than the baseline by
+more than the tolerance.
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import resource
+
+import common
+
+CASES = (
+    'main_config_populate:10', 'main_config_populate:200',
+    'main_config_ok:10', 'main_config_ok:200',
+    'raw_config_dialog:10', 'raw_config_dialog:1000', 'raw_config_dialog:50000',
+    'section_tab_save:10', 'section_tab_save:1000', 'section_tab_save:50000',
+    'setup_worker',
+)
+
+OPTIONS_PER_SECTION = 50
+
+def peak_rss():
+    # KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+class SyntheticConfig(object):
+    """
+    Stands in for cbpos.config with generated sections, saved as an INI file.
+    """
+
+    def __init__(self, filename, options, per_section=OPTIONS_PER_SECTION):
+        self.filename = filename
+        self.sections = []
+        for i in xrange(0, options, per_section):
+            section = {}
+            for j in xrange(i, min(i + per_section, options)):
+                kind = j % 4
+                if kind == 0:
+                    value = u'value-{}'.format(j)
+                elif kind == 1:
+                    value = bool(j % 3)
+                elif kind == 2:
+                    value = j
+                else:
+                    value = [u'a{}'.format(j), u'b{}'.format(j)]
+                section['option{}'.format(j)] = value
+            self.sections.append(('mod.synthetic{}'.format(i // per_section), section))
+        self.save()
+
+    def __iter__(self):
+        return iter(self.sections)
+
+    def __getitem__(self, key):
+        if isinstance(key, tuple):
+            # Unset options are None, as with cbpos.config
+            section, option = key
+            return dict(self.sections).get(section, {}).get(option)
+        return dict(self.sections)[key]
+
+    def __setitem__(self, key, value):
+        if isinstance(key, tuple):
+            section, option = key
+            dict(self.sections)[section][option] = value
+        elif value is None:
+            self.sections = [(n, s) for n, s in self.sections if n != key]
+
+    def save(self):
+        with open(self.filename, 'wb') as f:
+            for name, section in self.sections:
+                f.write('[{}]\n'.format(name).encode('utf-8'))
+                for option, value in sorted(section.items()):
+                    if isinstance(value, list):
+                        value = ','.join(value)
+                    f.write(u'{} = {}\n'.format(option, value).encode('utf-8'))
+                f.write(b'\n')
+
+    def save_defaults(self, overwrite=False):
+        pass
+
+def synthetic_pages():
+    """
+    Config pages of synthetic modules, each editing one section of cbpos.config.
+    """
+    import cbpos
+    from PySide import QtGui
+
+    from cbmod.config.controllers.registry import ConfigPageRegistry
+
+    class SyntheticModule(object):
+        def __init__(self, i):
+            self.name = self.base_name = 'synthetic{}'.format(i)
+
+    class SyntheticPage(QtGui.QWidget):
+        section = None
+
+        def __init__(self):
+            super(SyntheticPage, self).__init__()
+            layout = QtGui.QFormLayout()
+            self.fields = {}
+            for option in sorted(cbpos.config[self.section]):
+                self.fields[option] = field = QtGui.QLineEdit()
+                layout.addRow(option, field)
+            self.setLayout(layout)
+
+        def populate(self):
+            for option, field in self.fields.iteritems():
+                field.setText(unicode(cbpos.config[self.section, option]))
+
+        def update(self):
+            for option, field in self.fields.iteritems():
+                cbpos.config[self.section, option] = field.text()
+
+    class SyntheticRegistry(ConfigPageRegistry):
+        def results(self):
+            results = []
+            for i, (name, section) in enumerate(cbpos.config):
+                page = type('SyntheticPage{}'.format(i), (SyntheticPage,), {'section': name, 'label': name})
+                results.append((SyntheticModule(i), [page]))
+            return results
+
+    return SyntheticRegistry()
+
+def timed(func):
+    before = peak_rss()
+    start = time.time()
+    func()
+    return {'wall': time.time() - start, 'peak_rss': peak_rss(), 'peak_rss_growth': peak_rss() - before}
+
+def run_case(case, workdir):
+    import cbpos
+    from PySide import QtCore, QtGui
+
+    name, _, size = case.partition(':')
+    size = int(size) if size else 0
+
+    if name in ('main_config_populate', 'main_config_ok'):
+        from cbmod.config.views import config as config_view
+        # One section of 10 options per module page
+        cbpos.config = SyntheticConfig(os.path.join(workdir, 'synthetic.cfg'), size * 10, 10)
+        config_view.config_pages = synthetic_pages()
+        # The message boxes would block the benchmark
+        QtGui.QMessageBox.information = staticmethod(lambda *args, **kwargs: QtGui.QMessageBox.Ok)
+        page = config_view.MainConfigPage()
+        if name == 'main_config_populate':
+            return timed(page.populate)
+        page.populate()
+        # Load every tab, as a user going through all of them would
+        for i in xrange(page.tabs.count()):
+            page.tabs.setCurrentIndex(i)
+
+        errors = []
+        page.writer.saveError.connect(lambda ticket, e: errors.append(e), QtCore.Qt.DirectConnection)
+
+        def save():
+            page.onOkButton()
+            # The save itself runs on the config writer thread
+            page.writer.flush()
+        result = timed(save)
+        if errors:
+            raise RuntimeError('The config save failed: {}'.format(errors[0]))
+        return result
+
+    elif name == 'raw_config_dialog':
+        from cbmod.config.views.dialogs.raw import RawConfigDialog
+        cbpos.config = SyntheticConfig(os.path.join(workdir, 'synthetic.cfg'), size)
+        return timed(RawConfigDialog)
+
+    elif name == 'section_tab_save':
+        from cbmod.config.views.dialogs.raw import SectionTab
+        config = SyntheticConfig(os.path.join(workdir, 'synthetic.cfg'), size)
+        section = {}
+        for _, s in config:
+            section.update(s)
+        tab = SectionTab(section)
+        return timed(tab.save)
+
+    elif name == 'setup_worker':
+        return run_setup_worker(workdir)
+
+    raise ValueError('Unknown case {}'.format(case))
+
+def run_setup_worker(workdir):
+    from cbpos.database import Profile, Driver
+
+    from cbmod.config.views.widgets.database import DatabaseSetupWorker
+
+    profile = Profile(name='benchmark', driver=Driver.get('sqlite'))
+    profile.database = os.path.join(workdir, 'benchmark.sqlite')
+    profile.use()
+
+    worker = DatabaseSetupWorker()
+    errors = []
+    worker.stateError.connect(lambda state, e: errors.append((state, e)))
+
+    phases = (('init', worker.STATE_INIT), ('load', worker.STATE_LOAD),
+              ('create', worker.STATE_CREATE), ('test', worker.STATE_TEST),
+              ('done', worker.STATE_DONE))
+    result = {}
+    for phase, state in phases:
+        # The main thread communicator runs the phase synchronously
+        result[phase] = timed(lambda: worker.on_main.runState(state))
+        if errors:
+            raise RuntimeError('Phase {} failed: {!r}'.format(phase, errors[0][1]))
+    result['wall'] = sum(r['wall'] for r in result.values())
+    result['peak_rss'] = peak_rss()
+    result['database_size'] = os.path.getsize(profile.database)
+    return result
+
+def child(args):
+    def run():
+        workdir = tempfile.mkdtemp(prefix='cbmod-bench-')
+        try:
+            common.dump_json(run_case(args.case[0], workdir), args.result)
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    common.run_in_coinbox('raw-config', run, args.launcher)
+
+def measure(case, args):
+    fd, result = tempfile.mkstemp(suffix='.json')
+    os.close(fd)
+    home = tempfile.mkdtemp(prefix='cbmod-bench-home-')
+    try:
+        env = common.headless_env({'HOME': home})
+        command = [os.path.abspath(__file__), '--child', '--case', case, '--result', result]
+        if args.launcher:
+            command += ['--launcher', args.launcher]
+        returncode, _ = common.run_child(command, env=env, xvfb=args.xvfb, timeout=args.timeout)
+        data = common.load_json(result)
+        if not data:
+            raise RuntimeError('Case {} failed (status {})'.format(case, returncode))
+        return data
+    finally:
+        os.remove(result)
+        shutil.rmtree(home, ignore_errors=True)
+
+def compare(results, baseline, tolerance):
+    """
+    The measures that grew by more than `tolerance` (a ratio) over the baseline.
+    """
+    regressions = []
+    for case, measures in results.items():
+        for key in ('wall', 'peak_rss'):
+            old = baseline.get(case, {}).get(key)
+            new = measures.get(key)
+            if old and new is not None and new > old * (1 + tolerance):
+                regressions.append((case, key, old, new))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--case', action='append', help='case to run (default: all), e.g. raw_config_dialog:1000')
+    parser.add_argument('--runs', type=int, default=3, help='runs per case, the median is kept')
+    parser.add_argument('--baseline', default=os.path.join(common.HERE, 'baseline.json'))
+    parser.add_argument('--save-baseline', action='store_true', help='store the results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed growth over the baseline')
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    parser.add_argument('--launcher', help='Coinbox launcher as module:function')
+    parser.add_argument('--xvfb', action='store_true', help='run the children under xvfb-run')
+    parser.add_argument('--timeout', type=float, default=600)
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--result', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        return child(args)
+
+    results = {}
+    for case in args.case or CASES:
+        runs = [measure(case, args) for _ in xrange(max(args.runs, 1))]
+        runs.sort(key=lambda r: r['wall'])
+        results[case] = runs[len(runs) // 2]
+
+    common.dump_json(results, args.output)
+
+    if args.save_baseline:
+        common.dump_json(results, args.baseline)
+        return 0
+
+    regressions = compare(results, common.load_json(args.baseline, {}), args.tolerance)
+    for case, key, old, new in regressions:
+        sys.stderr.write('Regression: {} {} {!r} -> {!r}\n'.format(case, key, old, new))
+    return 1 if regressions else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
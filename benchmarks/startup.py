@@ -0,0 +1,119 @@
+"""
+Time-to-first-window and import-time benchmark of the `config` and
+`raw-config` entry points.
+
+Every run starts a fresh process that launches Coinbox with the entry
+point, records the time the first window is up and the import time of
+every module, then quits. The first run is reported as cold (optionally
+after purging the bytecode caches of this module with --purge-bytecode),
+the median of the following runs as warm.
+
+    python benchmarks/startup.py [--runs 5] [--budget benchmarks/budget.json]
+
+Exits with status 1 when a measure exceeds its budget.
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+import common
+
+ENTRY_POINTS = ('config', 'raw-config')
+
+def child(args):
+    """
+    Runs in the benchmarked process.
+    """
+    timer = common.ImportTimer()
+    timer.install()
+
+    def report():
+        timer.uninstall()
+        common.dump_json({
+            'launched': float(os.environ['CBMOD_BENCH_LAUNCHED']),
+            'first_window': time.time(),
+            'imports': timer.modules,
+            'imported_by_config': timer.imported_by('cbmod.config'),
+        }, args.result)
+
+    common.run_in_coinbox(args.entry, report, args.launcher)
+
+def purge_bytecode():
+    for dirpath, dirnames, filenames in os.walk(os.path.join(common.ROOT, 'cbmod')):
+        for filename in filenames:
+            if filename.endswith(('.pyc', '.pyo')):
+                os.remove(os.path.join(dirpath, filename))
+
+def measure(entry, args):
+    fd, result = tempfile.mkstemp(suffix='.json')
+    os.close(fd)
+    try:
+        env = common.headless_env({'CBMOD_BENCH_LAUNCHED': repr(time.time())})
+        command = [os.path.abspath(__file__), '--child', '--entry', entry, '--result', result]
+        if args.launcher:
+            command += ['--launcher', args.launcher]
+        returncode, wall = common.run_child(command, env=env, xvfb=args.xvfb, timeout=args.timeout)
+        data = common.load_json(result)
+        if not data:
+            raise RuntimeError('{} did not report its first window (status {})'.format(entry, returncode))
+    finally:
+        os.remove(result)
+    data['time_to_first_window'] = data['first_window'] - data['launched']
+    data['wall'] = wall
+    return data
+
+def summarize(runs, top):
+    cold, warm = runs[0], runs[1:] or runs[:1]
+    # Every import is kept: the budget covers the modules outside the
+    # slowest ones too, only the report is limited to the top ones
+    imports = {}
+    for name in warm[0]['imports']:
+        imports[name] = common.median([r['imports'][name]['cumulative'] for r in warm if name in r['imports']])
+    return {
+        'cold': {'time_to_first_window': cold['time_to_first_window']},
+        'warm': {'time_to_first_window': common.median([r['time_to_first_window'] for r in warm])},
+        'import_time': imports,
+        'slowest_imports': sorted(imports, key=lambda name: -imports[name])[:top],
+        'imported_by_config': cold['imported_by_config'],
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--entry', choices=ENTRY_POINTS, action='append',
+                        help='entry point to measure (default: all)')
+    parser.add_argument('--runs', type=int, default=5, help='runs per entry point')
+    parser.add_argument('--top', type=int, default=25, help='number of slowest imports reported')
+    parser.add_argument('--budget', default=os.path.join(common.HERE, 'budget.json'))
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    parser.add_argument('--launcher', help='Coinbox launcher as module:function')
+    parser.add_argument('--purge-bytecode', action='store_true',
+                        help='remove the bytecode caches of this module before the cold run')
+    parser.add_argument('--xvfb', action='store_true', help='run the children under xvfb-run')
+    parser.add_argument('--timeout', type=float, default=120)
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--result', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        args.entry = args.entry[0]
+        return child(args)
+
+    results = {}
+    for entry in args.entry or ENTRY_POINTS:
+        if args.purge_bytecode:
+            purge_bytecode()
+        runs = [measure(entry, args) for _ in xrange(max(args.runs, 1))]
+        results[entry] = summarize(runs, args.top)
+
+    common.dump_json(results, args.output)
+
+    budget = common.load_json(args.budget, {}).get('startup', {})
+    failures = common.check_budget(results, budget)
+    for key, value, limit in failures:
+        sys.stderr.write('Over budget: {} = {!r} (budget {!r})\n'.format(key, value, limit))
+    return 1 if failures else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,253 @@
+import os
+import sys
+import hashlib
+import collections
+import multiprocessing
+import ConfigParser
+
+import cbpos
+
+logger = cbpos.get_logger(__name__)
+
+from cbmod.config.controllers import snapshot
+
+MISSING = None
+
+class AuditError(Exception):
+    pass
+
+def digest(value):
+    return hashlib.sha1(value.encode('utf-8')).hexdigest()[:16]
+
+def section_digest(options):
+    return digest(u'\n'.join(u'{}={}'.format(o, h) for o, h in sorted(options.iteritems())))
+
+def fingerprint(data):
+    """
+    {section: (section hash, {option: value hash})} of a config dict.
+    """
+    result = {}
+    for section_name, section in data.iteritems():
+        options = dict((option, digest(value)) for option, value in section.iteritems())
+        result[section_name] = (section_digest(options), options)
+    return result
+
+def parse(filename):
+    """
+    The config dict of a file and its fingerprints, or the parse error.
+    A valid snapshot next to the file is used instead of parsing it.
+    """
+    try:
+        data = snapshot.load_or_parse(filename)
+    except (IOError, ConfigParser.Error) as e:
+        return None, None, str(e)
+    except UnicodeDecodeError as e:
+        return None, None, 'not UTF-8 ({})'.format(e)
+    return data, fingerprint(data), None
+
+def parse_terminal(args):
+    """
+    Runs in the worker processes, parses the config of one terminal.
+    """
+    terminal, filename = args
+    return (terminal,) + parse(filename)
+
+def defaults():
+    """
+    The config dict of the config_defaults of every loaded module.
+    """
+    from cbpos.modules import all_loaders
+    data = {}
+    for mod in all_loaders():
+        metadata = getattr(mod, 'metadata', mod)
+        for section_name, options in getattr(metadata, 'config_defaults', ()):
+            data.setdefault(section_name, {}).update(
+                (option, unicode(value)) for option, value in options.iteritems())
+    return data
+
+class SectionVariant(object):
+    def __init__(self, section_hash, options, values):
+        self.hash = section_hash
+        self.options = options
+        self.values = values
+        self.terminals = []
+
+class FleetAudit(object):
+    """
+    Groups the terminals by identical sections and finds the options that
+    differ from the fleet majority, or from a reference config when given.
+
+    With `partial`, as for the module defaults, only the options of the
+    reference are compared, and a terminal that does not set one of them
+    runs with its reference value.
+    """
+
+    def __init__(self, reference=None, partial=False):
+        self.reference = fingerprint(reference) if reference is not None else None
+        self.reference_values = reference
+        self.partial = partial and reference is not None
+        self.terminals = []
+        self.errors = {}
+        # section -> section hash -> SectionVariant
+        self.sections = collections.defaultdict(dict)
+
+    def effective(self, data, fingerprints):
+        """
+        The config dict and fingerprints of a terminal restricted to the
+        options of the reference, unset options taking the reference value.
+        """
+        values = {}
+        result = {}
+        for section_name, (_, expected) in self.reference.iteritems():
+            own = fingerprints.get(section_name, (MISSING, {}))[1]
+            own_values = data.get(section_name, {})
+            reference_values = self.reference_values[section_name]
+            options = dict((o, own.get(o, h)) for o, h in expected.iteritems())
+            values[section_name] = dict((o, own_values.get(o, reference_values[o])) for o in expected)
+            result[section_name] = (section_digest(options), options)
+        return values, result
+
+    def add(self, terminal, data, fingerprints):
+        self.terminals.append(terminal)
+        if self.partial:
+            data, fingerprints = self.effective(data, fingerprints)
+        for section_name, (section_hash, options) in fingerprints.iteritems():
+            variants = self.sections[section_name]
+            if section_hash not in variants:
+                variants[section_hash] = SectionVariant(section_hash, options, data[section_name])
+            variants[section_hash].terminals.append(terminal)
+
+    def run(self, terminals, jobs=None):
+        """
+        Parse and add the [(terminal, filename)] given by collect().
+        """
+        pool = multiprocessing.Pool(processes=jobs)
+        try:
+            for terminal, data, fingerprints, error in pool.imap_unordered(parse_terminal, terminals, chunksize=16):
+                if error is not None:
+                    self.errors[terminal] = error
+                else:
+                    self.add(terminal, data, fingerprints)
+        finally:
+            pool.close()
+            pool.join()
+        self.terminals.sort()
+
+    def variants(self, section_name):
+        """
+        The variants of a section, most common first. Terminals without the
+        section are a variant of their own, with a None hash.
+        """
+        variants = sorted(self.sections[section_name].values(), key=lambda v: (-len(v.terminals), v.hash))
+        having = sum(len(v.terminals) for v in variants)
+        if having < len(self.terminals):
+            missing = SectionVariant(MISSING, {}, {})
+            present = set(t for v in variants for t in v.terminals)
+            missing.terminals = [t for t in self.terminals if t not in present]
+            variants.append(missing)
+            variants.sort(key=lambda v: -len(v.terminals))
+        return variants
+
+    def expected(self, section_name, variants):
+        """
+        (section hash, option hashes, values) the section is compared with.
+        """
+        if self.reference is not None:
+            section_hash, options = self.reference.get(section_name, (MISSING, {}))
+            return section_hash, options, self.reference_values.get(section_name, {})
+        return variants[0].hash, variants[0].options, variants[0].values
+
+    def differences(self):
+        """
+        [(section, variants, differing options)] for the sections where a
+        terminal deviates.
+        """
+        result = []
+        section_names = set(self.sections)
+        if self.reference is not None:
+            section_names |= set(self.reference)
+        for section_name in sorted(section_names):
+            variants = self.variants(section_name)
+            expected_hash, expected_options, _ = self.expected(section_name, variants)
+            if all(v.hash == expected_hash for v in variants):
+                continue
+            options = set(expected_options)
+            for v in variants:
+                options |= set(v.options)
+            differing = sorted(o for o in options
+                               if any(v.options.get(o) != expected_options.get(o) for v in variants))
+            result.append((section_name, variants, differing))
+        return result
+
+    def write_report(self, out=None, width=16, max_terminals=10):
+        out = out if out is not None else sys.stdout
+
+        def cell(value):
+            value = u'<missing>' if value is None else value
+            return value if len(value) <= width else value[:width - 3] + u'...'
+
+        against = 'the reference' if self.reference is not None else 'the fleet majority'
+        out.write(u'{} terminals compared with {}\n'.format(len(self.terminals), against))
+        for section_name, variants, differing in self.differences():
+            labels = [chr(ord('A') + i) if i < 26 else str(i) for i in xrange(len(variants))]
+            out.write(u'\n[{}] {} variants\n'.format(section_name, len(variants)))
+
+            columns = []
+            if self.reference is not None:
+                columns.append((u'ref', self.reference_values.get(section_name, {})))
+            for label, v in zip(labels, variants):
+                columns.append((u'{} ({})'.format(label, len(v.terminals)), v.values if v.hash else None))
+
+            name_width = max([len(o) for o in differing] + [6])
+            header = u'  {:<{w}}'.format(u'', w=name_width)
+            header += u''.join(u'  {:<{w}}'.format(title, w=width) for title, _ in columns)
+            out.write(header.rstrip() + u'\n')
+            for option in differing:
+                row = u'  {:<{w}}'.format(option, w=name_width)
+                row += u''.join(u'  {:<{w}}'.format(cell(values.get(option) if values is not None else None), w=width)
+                                for _, values in columns)
+                out.write(row.rstrip() + u'\n')
+
+            for label, v in zip(labels, variants)[1 if self.reference is None else 0:]:
+                shown = v.terminals[:max_terminals]
+                more = len(v.terminals) - len(shown)
+                out.write(u'  {}: {}{}\n'.format(label, u', '.join(shown),
+                                                u' (+{} more)'.format(more) if more else u''))
+
+        for terminal, error in sorted(self.errors.iteritems()):
+            out.write(u'\n{}: could not be parsed: {}\n'.format(terminal, error))
+
+def collect(paths):
+    """
+    [(terminal, filename)] of the config files among the given files and
+    directories. Terminals are named after their file, or when several
+    files share a name, as in a directory per terminal, after their path
+    relative to the given directory.
+    """
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            for dirpath, dirnames, names in os.walk(path):
+                found.extend((os.path.join(dirpath, n), os.path.relpath(os.path.join(dirpath, n), path))
+                             for n in names if not n.endswith(('.snapshot', '.history', '.sync', '.setup', '.tmp')))
+        else:
+            found.append((path, os.path.normpath(path)))
+
+    names = collections.defaultdict(int)
+    for filename, _ in found:
+        names[os.path.splitext(os.path.basename(filename))[0]] += 1
+
+    terminals = {}
+    files = {}
+    for filename, relative in found:
+        terminal = os.path.splitext(os.path.basename(filename))[0]
+        if names[terminal] > 1:
+            terminal = relative
+        real = os.path.realpath(filename)
+        if real in files:
+            raise AuditError('{} is given twice'.format(filename))
+        if terminal in terminals:
+            raise AuditError('{} and {} are both named {}'.format(terminals[terminal], filename, terminal))
+        files[real] = filename
+        terminals[terminal] = filename
+    return sorted(terminals.iteritems())
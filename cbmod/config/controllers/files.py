@@ -0,0 +1,32 @@
+import os
+
+MOVEFILE_REPLACE_EXISTING = 0x1
+MOVEFILE_WRITE_THROUGH = 0x8
+
+def replace(source, target):
+    """
+    Rename `source` to `target`, replacing it atomically if it exists.
+    """
+    if hasattr(os, 'replace'):
+        os.replace(source, target)
+    elif os.name == 'nt':
+        # rename() does not replace existing files on Windows
+        import ctypes
+        if not ctypes.windll.kernel32.MoveFileExW(unicode(source), unicode(target),
+                                                  MOVEFILE_REPLACE_EXISTING | MOVEFILE_WRITE_THROUGH):
+            raise ctypes.WinError()
+    else:
+        os.rename(source, target)
+
+def atomic_write(filename, data):
+    """
+    Replace the content of `filename` with the bytes `data`, which are on
+    disk before the file is replaced, so that readers and crashes never
+    see a partial file.
+    """
+    temp = filename + '.tmp'
+    with open(temp, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    replace(temp, filename)
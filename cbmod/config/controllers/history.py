@@ -0,0 +1,187 @@
+import os
+import json
+import time
+
+import cbpos
+
+logger = cbpos.get_logger(__name__)
+
+CHECKPOINT, DELTA = 'C', 'D'
+
+MISSING = object()
+
+def diff(old, new):
+    """
+    The changes turning the config dict `old` into `new`: {section: None}
+    for a removed section, {section: {option: None}} for a removed option.
+    """
+    delta = {}
+    for section_name in set(old) | set(new):
+        if section_name not in new:
+            delta[section_name] = None
+            continue
+        old_section = old.get(section_name, {})
+        new_section = new[section_name]
+        changes = dict((option, value) for option, value in new_section.iteritems()
+                       if old_section.get(option, MISSING) != value)
+        changes.update((option, None) for option in old_section if option not in new_section)
+        if changes or section_name not in old:
+            delta[section_name] = changes
+    return delta
+
+def patch(state, delta):
+    for section_name, changes in delta.iteritems():
+        if changes is None:
+            state.pop(section_name, None)
+            continue
+        section = state.setdefault(section_name, {})
+        for option, value in changes.iteritems():
+            if value is None:
+                section.pop(option, None)
+            else:
+                section[option] = value
+    return state
+
+class HistoryEntry(object):
+    def __init__(self, version, kind, timestamp, offset):
+        self.version = version
+        self.kind = kind
+        self.timestamp = timestamp
+        self.offset = offset
+
+class ConfigHistory(object):
+    """
+    Append-only history of the saved config, in <config file>.history.
+
+    Every line is "<version> <kind> <timestamp> <json>". Most versions are
+    stored as deltas holding the changed options only; every
+    `checkpoint_interval` versions the full config is stored instead, so
+    restoring a version replays at most that many deltas.
+    """
+
+    def __init__(self, filename, checkpoint_interval=50):
+        self.filename = filename
+        self.checkpoint_interval = max(int(checkpoint_interval), 1)
+        self.__head = None
+
+    def entries(self):
+        """
+        The recorded versions, reading only the line headers.
+        """
+        entries = []
+        if not os.path.exists(self.filename):
+            return entries
+        with open(self.filename, 'rb') as f:
+            offset = 0
+            for line in f:
+                try:
+                    version, kind, timestamp, _ = line.split(b' ', 3)
+                    entries.append(HistoryEntry(int(version), kind.decode('ascii'), float(timestamp), offset))
+                except ValueError:
+                    logger.warn('Skipping corrupted line in %s', self.filename)
+                offset += len(line)
+        return entries
+
+    def restore(self, version=None):
+        """
+        The config dict as of `version` (default: the latest one).
+        """
+        entries = self.entries()
+        if version is None:
+            if not entries:
+                return 0, {}
+            version = entries[-1].version
+        start = None
+        for entry in entries:
+            if entry.version > version:
+                break
+            if entry.kind == CHECKPOINT:
+                start = entry
+        if start is None:
+            raise KeyError('No checkpoint before version {}'.format(version))
+
+        state = {}
+        with open(self.filename, 'rb') as f:
+            f.seek(start.offset)
+            for line in f:
+                try:
+                    v, kind, _, data = line.split(b' ', 3)
+                    v = int(v)
+                except ValueError:
+                    continue
+                if v > version:
+                    break
+                data = json.loads(data.decode('utf-8'))
+                if kind == CHECKPOINT.encode('ascii'):
+                    state = data
+                else:
+                    patch(state, data)
+        return version, state
+
+    def head(self):
+        if self.__head is None:
+            self.__head = self.restore()
+        return self.__head
+
+    def append(self, version, kind, data):
+        line = u'{} {} {:.3f} {}\n'.format(version, kind, time.time(),
+                                          json.dumps(data, sort_keys=True, separators=(',', ':')))
+        with open(self.filename, 'ab') as f:
+            f.write(line.encode('utf-8'))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def record(self, state):
+        """
+        Record a saved config dict as a new version, if it changed.
+        Returns the new version or None.
+        """
+        version, previous = self.head()
+        delta = diff(previous, state)
+        if version and not delta:
+            return None
+        version += 1
+        if version == 1 or version % self.checkpoint_interval == 0:
+            self.append(version, CHECKPOINT, state)
+        else:
+            self.append(version, DELTA, delta)
+        self.__head = (version, patch(dict((s, dict(o)) for s, o in previous.iteritems()), delta))
+        return version
+
+_history = None
+
+def get_history():
+    """
+    The history of cbpos.config, kept around so that its head is only read once.
+    """
+    global _history
+    filename = cbpos.config.filename + '.history'
+    if _history is None or _history.filename != filename:
+        _history = ConfigHistory(filename, cbpos.config['mod.config', 'history_checkpoint_interval'] or 50)
+    return _history
+
+def dump(config=None):
+    """
+    A config dict copy of `config` (default: cbpos.config).
+    """
+    config = config if config is not None else cbpos.config
+    return dict((section_name, dict(section.iteritems())) for section_name, section in config)
+
+def apply(state, config=None):
+    """
+    Make `config` (default: cbpos.config) hold exactly the values of a config dict.
+    """
+    config = config if config is not None else cbpos.config
+    apply_delta(diff(dump(config), state), config)
+
+def apply_delta(delta, config=None):
+    """
+    Make the changes of a diff() in `config` (default: cbpos.config).
+    """
+    config = config if config is not None else cbpos.config
+    for section_name, changes in delta.iteritems():
+        if changes is None:
+            config[section_name] = None
+            continue
+        for option, value in changes.iteritems():
+            config[section_name, option] = value
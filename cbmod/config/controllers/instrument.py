@@ -0,0 +1,151 @@
+from PySide import QtCore, QtGui
+
+import os
+import gc
+import functools
+
+import cbpos
+
+logger = cbpos.get_logger(__name__)
+
+def rss():
+    """
+    Resident set size of the process in KiB, None where it is not known.
+    """
+    try:
+        with open('/proc/self/statm', 'rb') as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') // 1024
+    except (IOError, OSError, ValueError, IndexError, AttributeError):
+        return None
+
+class Sample(object):
+    def __init__(self):
+        app = QtGui.QApplication.instance()
+        # The overlays are part of the instrumentation, not of the pages
+        self.widgets = sum(1 for w in app.allWidgets()
+                           if not isinstance(w, MemoryOverlay)) if app is not None else 0
+        self.objects = len(gc.get_objects())
+        self.rss = rss()
+
+    def delta(self, other):
+        def diff(a, b):
+            return None if a is None or b is None else a - b
+        return (diff(self.widgets, other.widgets),
+                diff(self.objects, other.objects),
+                diff(self.rss, other.rss))
+
+class Instrument(object):
+    """
+    Opt-in tracking of the live QWidgets, Python objects and RSS around
+    the populate, save and close of the config pages and dialogs.
+
+    Every measure is logged and shown in an overlay on the measured
+    widget. When a page is hidden, the widgets still alive are compared
+    with the count before it was first populated; a growth above the
+    mod.config/instrument_widget_budget option is logged as a warning.
+    """
+
+    UNSET = object()
+
+    def __init__(self):
+        self.__enabled = self.UNSET
+        self.budget = None
+        # page name -> sample before its first populate
+        self.baselines = {}
+
+    def configure(self, enabled, budget=None):
+        self.__enabled = enabled not in (None, False, '', '0', 'false', 'no')
+        self.budget = int(budget) if budget not in (None, '') else None
+        if self.__enabled:
+            logger.info('Config page instrumentation enabled')
+
+    @property
+    def enabled(self):
+        if self.__enabled is self.UNSET:
+            self.configure(cbpos.config['mod.config', 'instrument'],
+                           cbpos.config['mod.config', 'instrument_widget_budget'])
+        return self.__enabled
+
+    def record(self, widget, name, event, before, after):
+        widgets, objects, memory = after.delta(before)
+        line = '{} {}: widgets {} ({:+d}), objects {} ({:+d}), rss {}'.format(
+                    name, event, after.widgets, widgets, after.objects, objects,
+                    '{} KiB ({:+d})'.format(after.rss, memory) if memory is not None else 'n/a')
+        logger.info('Config memory: %s', line)
+        if widget is not None:
+            MemoryOverlay.show_on(widget, line)
+
+    def run(self, widget, name, event, func, *args, **kwargs):
+        before = Sample()
+        if event == 'populate':
+            self.baselines.setdefault(name, before)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self.record(widget, name, event, before, Sample())
+
+    def measure(self, widget, name, event, func, *args, **kwargs):
+        """
+        run() when instrumentation is enabled, a plain call otherwise.
+        """
+        if not self.enabled:
+            return func(*args, **kwargs)
+        return self.run(widget, name, event, func, *args, **kwargs)
+
+    def check(self, name, event, sample):
+        """
+        Log a sample of a page compared with the one before its first
+        populate, and warn when its widgets grew over the budget.
+        """
+        baseline = self.baselines.get(name, sample)
+        self.record(None, name, event, baseline, sample)
+        if self.budget is not None:
+            growth = sample.widgets - baseline.widgets
+            if growth > self.budget:
+                logger.warn('Config memory: %s leaves %d widgets behind, over the budget of %d',
+                            name, growth, self.budget)
+
+    def closed(self, name):
+        """
+        Measure what a page leaves behind when it is hidden, and again once
+        the deferred deletions have run, if the application is still
+        running by then.
+        """
+        self.check(name, 'close', Sample())
+        QtCore.QTimer.singleShot(100, lambda: self.check(name, 'closed', Sample()))
+
+instrument = Instrument()
+
+def instrumented(name, event):
+    """
+    Decorator measuring every call of a widget method when instrumentation
+    is enabled.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            return instrument.measure(self, name, event, func, self, *args, **kwargs)
+        return wrapper
+    return decorator
+
+class MemoryOverlay(QtGui.QLabel):
+    """
+    Debug overlay in the top right corner of an instrumented widget.
+    """
+
+    def __init__(self, parent):
+        super(MemoryOverlay, self).__init__(parent)
+        self.setAttribute(QtCore.Qt.WA_TransparentForMouseEvents)
+        self.setStyleSheet('background: rgba(0, 0, 0, 160); color: white; padding: 2px;')
+
+    @classmethod
+    def show_on(cls, widget, text):
+        overlay = widget.findChild(cls)
+        if overlay is None:
+            overlay = cls(widget)
+        overlay.setText(text)
+        overlay.adjustSize()
+        overlay.move(max(widget.width() - overlay.width(), 0), 0)
+        overlay.show()
+        overlay.raise_()
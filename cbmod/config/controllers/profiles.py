@@ -0,0 +1,43 @@
+import cbpos
+
+logger = cbpos.get_logger(__name__)
+
+from cbpos.database import Profile
+
+class ProfileIndex(object):
+    """
+    In-memory index of the database profiles by name.
+
+    The profile store is read once and kept until invalidate() is called,
+    which must be done whenever a profile is created, renamed or deleted.
+    """
+
+    def __init__(self):
+        self.__by_name = None
+        self.__names = None
+
+    def __load(self):
+        if self.__by_name is None:
+            logger.debug('Indexing database profiles')
+            self.__by_name = dict((p.name, p) for p in Profile.get_all())
+            self.__names = sorted(self.__by_name, key=lambda n: n.lower())
+        return self.__by_name
+
+    def names(self):
+        self.__load()
+        return self.__names
+
+    def get(self, name):
+        return self.__load().get(name)
+
+    def __contains__(self, name):
+        return name in self.__load()
+
+    def __len__(self):
+        return len(self.__load())
+
+    def invalidate(self):
+        self.__by_name = None
+        self.__names = None
+
+profiles = ProfileIndex()
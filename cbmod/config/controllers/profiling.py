@@ -0,0 +1,137 @@
+import os
+import sys
+import time
+import tempfile
+import threading
+import functools
+import collections
+
+import cbpos
+
+logger = cbpos.get_logger(__name__)
+
+MODES = ('cprofile', 'sample', 'both')
+
+class Sampler(threading.Thread):
+    """
+    Samples the stack of one thread at a fixed interval and counts the
+    collapsed stacks, in the format read by flame graph tools.
+    """
+
+    def __init__(self, thread_id, interval=0.005):
+        super(Sampler, self).__init__(name='cbmod-config-sampler')
+        self.daemon = True
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self.__stop = threading.Event()
+
+    def run(self):
+        while not self.__stop.is_set():
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append('{}:{}:{}'.format(os.path.basename(code.co_filename),
+                                               code.co_name, frame.f_lineno))
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+            self.__stop.wait(self.interval)
+
+    def stop(self):
+        self.__stop.set()
+        self.join()
+
+    def dump(self, filename):
+        with open(filename, 'wb') as f:
+            for stack, count in self.stacks.most_common():
+                f.write('{} {}\n'.format(stack, count).encode('utf-8'))
+
+class Profiler(object):
+    """
+    Opt-in capture of the time spent in the config entry points and in the
+    database setup phases. Every phase is written to its own file in the
+    profile directory: <time>-<phase>.prof (cProfile, read with pstats) and
+    <time>-<phase>.folded (collapsed stack samples).
+
+    The mode is read once from the mod.config/profile option, unless set
+    from the command line with configure().
+    """
+
+    UNSET = object()
+
+    def __init__(self):
+        self.__mode = self.UNSET
+        self.directory = None
+        self.__local = threading.local()
+
+    def configure(self, mode, directory=None):
+        if mode and mode not in MODES:
+            raise ValueError('Unknown profiling mode {!r}'.format(mode))
+        self.__mode = mode or None
+        self.directory = directory or None
+        if self.__mode:
+            logger.info('Profiling enabled (%s), writing to %s', self.__mode, self.get_directory())
+
+    @property
+    def enabled(self):
+        if self.__mode is self.UNSET:
+            self.configure(cbpos.config['mod.config', 'profile'],
+                           cbpos.config['mod.config', 'profile_dir'])
+        return self.__mode is not None
+
+    def get_directory(self):
+        directory = self.directory or os.path.join(tempfile.gettempdir(), 'coinbox-profiles')
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        return directory
+
+    def run(self, name, func, *args, **kwargs):
+        # Nested phases are part of the outer phase capture
+        if getattr(self.__local, 'active', False):
+            return func(*args, **kwargs)
+        self.__local.active = True
+
+        profile = sampler = None
+        if self.__mode in ('cprofile', 'both'):
+            import cProfile
+            profile = cProfile.Profile()
+        if self.__mode in ('sample', 'both'):
+            sampler = Sampler(threading.current_thread().ident)
+            sampler.start()
+
+        start = time.time()
+        try:
+            if profile is not None:
+                return profile.runcall(func, *args, **kwargs)
+            return func(*args, **kwargs)
+        finally:
+            elapsed = time.time() - start
+            self.__local.active = False
+            prefix = os.path.join(self.get_directory(),
+                                  '{}-{}'.format(time.strftime('%Y%m%d-%H%M%S'), name))
+            if profile is not None:
+                profile.dump_stats(prefix + '.prof')
+            if sampler is not None:
+                sampler.stop()
+                sampler.dump(prefix + '.folded')
+            logger.info('Profiled %s in %.3fs: %s.*', name, elapsed, prefix)
+
+profiler = Profiler()
+
+def profiled(name):
+    """
+    Decorator that captures every call of the method as a phase when
+    profiling is enabled. `name` is the phase name, or a function of the
+    method arguments returning it.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not profiler.enabled:
+                return func(*args, **kwargs)
+            phase = name(*args, **kwargs) if callable(name) else name
+            return profiler.run(phase, func, *args, **kwargs)
+        return wrapper
+    return decorator
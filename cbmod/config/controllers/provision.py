@@ -0,0 +1,89 @@
+import sys
+import time
+import multiprocessing
+
+import cbpos
+
+logger = cbpos.get_logger(__name__)
+
+from cbmod.config.controllers.setup import SetupPipeline
+from cbmod.config.controllers.profiles import profiles
+
+PHASES = ('init', 'load', 'create', 'test', 'done')
+
+def provision_profile(args):
+    """
+    Rebuild the database of one profile from scratch. Runs in a worker
+    process of its own, so that every profile gets a fresh database engine
+    and model registry.
+    """
+    name, test = args
+    result = {'profile': name, 'phases': {}, 'error': None, 'phase': None}
+    start = time.time()
+    try:
+        # Point this process at the profile without Profile.use(), which
+        # saves it as the terminal's database: the workers would race on
+        # the config file and leave the terminal on the last one finished
+        cbpos.config['db', 'used'] = name
+        pipeline = SetupPipeline()
+        for phase in PHASES:
+            if phase == 'test' and not test:
+                continue
+            result['phase'] = phase
+            phase_start = time.time()
+            getattr(pipeline, phase)()
+            result['phases'][phase] = time.time() - phase_start
+        result['phase'] = None
+    except Exception as e:
+        logger.exception('Provisioning profile %s failed', name)
+        result['error'] = '{}: {}'.format(type(e).__name__, e)
+    result['total'] = time.time() - start
+    return result
+
+def provision(names, jobs=None, test=True):
+    """
+    Provision the given profiles, at most `jobs` at a time.
+    Returns the results in the order of `names`.
+    """
+    results = {}
+    todo = []
+    for name in names:
+        if name in profiles:
+            todo.append(name)
+        else:
+            results[name] = {'profile': name, 'phases': {}, 'total': 0.0,
+                             'phase': None, 'error': 'Profile not found'}
+
+    if todo:
+        jobs = max(1, min(jobs or multiprocessing.cpu_count(), len(todo)))
+        logger.info('Provisioning %d profiles, %d at a time', len(todo), jobs)
+        # One process per profile, nothing leaks from one profile to the next
+        pool = multiprocessing.Pool(processes=jobs, maxtasksperchild=1)
+        try:
+            for result in pool.imap_unordered(provision_profile, [(name, test) for name in todo]):
+                logger.info('Profile %s: %s', result['profile'], result['error'] or 'done')
+                results[result['profile']] = result
+        finally:
+            pool.close()
+            pool.join()
+
+    return [results[name] for name in names]
+
+def write_summary(results, out=None):
+    out = out if out is not None else sys.stdout
+    width = max([len('Profile')] + [len(r['profile']) for r in results])
+    header = u'{:<{w}}  '.format('Profile', w=width) + u''.join(u'{:>9}'.format(p) for p in PHASES + ('total',))
+    out.write(header + u'\n')
+    out.write(u'-' * len(header) + u'\n')
+    for r in results:
+        times = [r['phases'].get(p) for p in PHASES] + [r['total']]
+        out.write(u'{:<{w}}  '.format(r['profile'], w=width))
+        out.write(u''.join(u'{:>9}'.format('-' if t is None else '{:.2f}s'.format(t)) for t in times))
+        out.write(u'\n')
+    failed = [r for r in results if r['error']]
+    if failed:
+        out.write(u'\n')
+        for r in failed:
+            phase = u' during {}'.format(r['phase']) if r['phase'] else u''
+            out.write(u'{} failed{}: {}\n'.format(r['profile'], phase, r['error']))
+    out.write(u'\n{} profiles, {} failed\n'.format(len(results), len(failed)))
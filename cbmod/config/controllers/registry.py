@@ -0,0 +1,84 @@
+import importlib
+
+import cbpos
+
+logger = cbpos.get_logger(__name__)
+
+from cbpos.modules import all_loaders
+
+class ConfigPageEntry(object):
+    """
+    A configuration page registered by a module.
+
+    The page is either the page class itself or a "package.module:ClassName"
+    string, in which case the module is only imported when the page is loaded.
+    """
+
+    def __init__(self, module, page, label=None):
+        self.module = module
+        self.__page = page
+        self.__label = label
+
+    @property
+    def loaded(self):
+        return not isinstance(self.__page, basestring)
+
+    @property
+    def label(self):
+        if self.__label:
+            return self.__label
+        label = getattr(self.__page, 'label', None) if self.loaded else None
+        return label if label else '[%s]' % (self.module.name,)
+
+    def load(self):
+        if not self.loaded:
+            module_name, _, class_name = self.__page.partition(':')
+            logger.debug('Importing config page %s', self.__page)
+            self.__page = getattr(importlib.import_module(module_name), class_name)
+        return self.__page
+
+class HookRegistry(object):
+    """
+    Calls a module loader hook once on every loader that defines it, and
+    keeps the results until invalidated.
+    """
+
+    def __init__(self, hook):
+        self.hook = hook
+        self.__results = None
+
+    def results(self):
+        if self.__results is None:
+            self.__results = []
+            for mod in all_loaders():
+                hook = getattr(mod, self.hook, None)
+                if hook is None:
+                    continue
+                self.__results.append((mod, hook()))
+        return self.__results
+
+    def invalidate(self):
+        self.__results = None
+
+class ConfigPageRegistry(HookRegistry):
+    def __init__(self):
+        super(ConfigPageRegistry, self).__init__('config_pages')
+        self.__entries = None
+
+    def entries(self):
+        if self.__entries is None:
+            self.__entries = []
+            for mod, pages in self.results():
+                for page in pages:
+                    if isinstance(page, tuple):
+                        label, page = page
+                    else:
+                        label = None
+                    self.__entries.append(ConfigPageEntry(mod, page, label))
+        return self.__entries
+
+    def invalidate(self):
+        super(ConfigPageRegistry, self).invalidate()
+        self.__entries = None
+
+config_pages = ConfigPageRegistry()
@@ -0,0 +1,115 @@
+from sqlalchemy import create_engine
+from sqlalchemy.schema import CreateIndex
+
+import cbpos
+
+logger = cbpos.get_logger(__name__)
+
+class SchemaScript(object):
+    """
+    The DDL of the loaded models, compiled for one SQL dialect.
+
+    Table statements and index statements are kept apart so that secondary
+    (non-unique) indexes can be created after the initial data is loaded.
+    """
+
+    def __init__(self, tables, indexes, dialect_name):
+        self.tables = tables
+        self.indexes = indexes
+        self.dialect_name = dialect_name
+
+    @classmethod
+    def compile(cls, metadata, engine):
+        """
+        Capture everything create_all() emits, including the DDL of types,
+        sequences and DDL event listeners, compiled for the dialect of
+        `engine`, its driver and server version.
+        """
+        dialect = engine.dialect
+        tables = []
+        indexes = []
+
+        def executor(sql, *multiparams, **params):
+            if isinstance(sql, basestring):
+                statement = sql.strip()
+            else:
+                statement = unicode(sql.compile(dialect=dialect)).strip()
+            if isinstance(sql, CreateIndex) and not sql.element.unique:
+                indexes.append(statement)
+            else:
+                # Unique indexes are constraints, they must exist before the data
+                tables.append(statement)
+
+        mock = create_engine(engine.url, strategy='mock', executor=executor)
+        metadata.create_all(mock, checkfirst=False)
+        # Tables come out of create_all() in dependency order, indexes do not
+        indexes.sort()
+        return cls(tables, indexes, dialect.name)
+
+    @property
+    def statements(self):
+        return self.tables + self.indexes
+
+    def render(self, statements=None):
+        statements = self.statements if statements is None else statements
+        return u''.join(u'{};\n\n'.format(s) for s in statements)
+
+    def export(self, filename):
+        with open(filename, 'wb') as f:
+            f.write(u'-- Coinbox POS database schema ({})\n\n'.format(self.dialect_name).encode('utf-8'))
+            f.write(u'BEGIN;\n\n'.encode('utf-8'))
+            f.write(self.render(self.tables).encode('utf-8'))
+            f.write(u'COMMIT;\n\n'.encode('utf-8'))
+            if self.indexes:
+                f.write(u'-- Secondary indexes, apply after loading the data\n\n'.encode('utf-8'))
+                f.write(self.render(self.indexes).encode('utf-8'))
+
+def get_metadata():
+    return cbpos.database.Base.metadata
+
+def get_engine():
+    return get_metadata().bind
+
+def compile_schema(engine=None):
+    engine = engine if engine is not None else get_engine()
+    return SchemaScript.compile(get_metadata(), engine)
+
+def apply_statements(statements, engine=None):
+    """
+    Execute the DDL statements in a single transaction, and in a single
+    round-trip when the DB-API driver allows it.
+    """
+    if not statements:
+        return
+    engine = engine if engine is not None else get_engine()
+
+    logger.debug('Applying %d DDL statements on %s', len(statements), engine.dialect.name)
+
+    if engine.dialect.name == 'sqlite':
+        # executescript() sends the whole script at once, wrapped in our own transaction
+        script = u'BEGIN;\n{}COMMIT;\n'.format(u''.join(u'{};\n'.format(s) for s in statements))
+        connection = engine.raw_connection()
+        try:
+            cursor = connection.cursor()
+            done = False
+            try:
+                cursor.executescript(script)
+                done = True
+            finally:
+                if not done:
+                    # sqlite3 does not track the BEGIN of the script, rollback()
+                    # would leave the transaction open and the database locked
+                    try:
+                        cursor.execute('ROLLBACK')
+                    except Exception:
+                        logger.debug('Nothing to roll back after the DDL script failed')
+        finally:
+            connection.close()
+    elif engine.dialect.name == 'postgresql':
+        # psycopg2 accepts several statements in one execute()
+        with engine.begin() as connection:
+            connection.execute(u''.join(u'{};\n'.format(s) for s in statements))
+    else:
+        with engine.begin() as connection:
+            for statement in statements:
+                connection.execute(statement)
@@ -0,0 +1,195 @@
+import json
+import hashlib
+
+import cbpos
+
+logger = cbpos.get_logger(__name__)
+
+from cbpos.modules import all_loaders
+
+from cbmod.config.controllers import schema
+from cbmod.config.controllers.files import atomic_write
+
+class SetupCheckpoint(object):
+    """
+    The database setup steps completed on a profile, kept in
+    <config file>.setup so that an interrupted setup can be resumed.
+
+    Connecting and loading the models are redone on every run, they are
+    needed in the process anyway. The schema creation, the test data of
+    every module and the deferred indexes are recorded as they complete,
+    tied to a fingerprint of the schema so that changed models start over.
+    They are kept per profile and database, a profile edited to point at
+    another database starts over too.
+    """
+
+    def __init__(self, profile, filename=None):
+        self.key = self.profile_key(profile)
+        self.filename = filename or cbpos.config.filename + '.setup'
+        self.schema = None
+        self.created = False
+        self.tested = []
+        self.testing = None
+        self.indexed = False
+        self.load()
+
+    @staticmethod
+    def profile_key(profile):
+        driver = getattr(profile.driver, 'name', profile.driver)
+        return u'|'.join(unicode(value) if value is not None else u''
+                         for value in (profile.name, driver, profile.host, profile.port, profile.database))
+
+    def __read_all(self):
+        try:
+            with open(self.filename, 'rb') as f:
+                return json.loads(f.read().decode('utf-8'))
+        except (IOError, ValueError):
+            return {}
+
+    def load(self):
+        data = self.__read_all().get(self.key, {})
+        self.schema = data.get('schema')
+        self.created = data.get('created', False)
+        self.tested = data.get('tested', [])
+        self.testing = data.get('testing')
+        self.indexed = data.get('indexed', False)
+
+    def save(self):
+        data = self.__read_all()
+        if self.schema is None:
+            data.pop(self.key, None)
+        else:
+            data[self.key] = {'schema': self.schema, 'created': self.created,
+                                       'tested': self.tested, 'testing': self.testing,
+                                       'indexed': self.indexed}
+        atomic_write(self.filename, json.dumps(data).encode('utf-8'))
+
+    def reset(self, schema=None):
+        self.schema = schema
+        self.created = False
+        self.tested = []
+        self.testing = None
+        self.indexed = False
+        self.save()
+
+    @property
+    def resumable(self):
+        return self.schema is not None and self.created
+
+class SetupPipeline(object):
+    """
+    The steps of the database setup, shared by the setup wizard worker and
+    the batch provisioning. `progress` is called with the completed
+    fraction of the running step.
+    """
+
+    def __init__(self, checkpoint=None, progress=None):
+        self.checkpoint = checkpoint
+        self.progress = progress if progress is not None else lambda fraction: None
+        self.script = None
+        # Module name -> the tables its models added
+        self.tables = {}
+        self.created = False
+        self.indexed = False
+
+    def init(self):
+        # Start the database AFTER potential changes in the configuration
+        cbpos.database.init()
+
+    def load(self):
+        # Load database models of every module
+        loaders = all_loaders()
+        count_loaders = float(len(loaders))
+        metadata = schema.get_metadata()
+        for i, mod in enumerate(loaders):
+            logger.debug('Loading DB models for %s', mod.base_name)
+            known = set(metadata.tables)
+            mod.load_models()
+            self.tables[mod.base_name] = [t for t in metadata.sorted_tables if t.key not in known]
+            self.progress(i / count_loaders)
+        self.script = schema.compile_schema()
+
+    @property
+    def fingerprint(self):
+        # Independent of the order of the statements, which can vary between runs
+        return hashlib.sha1(u'\n'.join(sorted(self.script.statements)).encode('utf-8')).hexdigest()
+
+    def create(self):
+        """
+        Flush the database and recreate the structure, unless the checkpoint
+        says it was created already with the same schema.
+        Returns False if the step was skipped.
+        """
+        fingerprint = self.fingerprint
+        if self.checkpoint is not None:
+            if self.checkpoint.created and self.checkpoint.schema == fingerprint:
+                logger.debug('Database already created, resuming')
+                self.created = True
+                self.indexed = self.checkpoint.indexed
+                return False
+            self.checkpoint.reset(fingerprint)
+
+        logger.debug('Clearing database...')
+        cbpos.database.clear()
+        self.progress(0.5)
+        logger.debug('Creating database...')
+        schema.apply_statements(self.script.tables)
+        self.created = True
+
+        if self.checkpoint is not None:
+            self.checkpoint.created = True
+            self.checkpoint.save()
+        return True
+
+    def clear_tables(self, module_name):
+        """
+        Delete the rows of the tables of a module.
+        """
+        tables = self.tables.get(module_name, [])
+        if not tables:
+            return
+        logger.debug('Clearing the test values of %s left by an interrupted run', module_name)
+        with schema.get_engine().begin() as connection:
+            for table in reversed(tables):
+                connection.execute(table.delete())
+
+    def test(self):
+        # Add initial testing values, skipping the modules done in a previous run
+        checkpoint = self.checkpoint
+        tested = checkpoint.tested if checkpoint is not None else []
+        loaders = all_loaders()
+        count_loaders = float(len(loaders))
+        for i, mod in enumerate(loaders):
+            if mod.base_name in tested:
+                logger.debug('Test values for %s already added', mod.base_name)
+            else:
+                if checkpoint is not None:
+                    if checkpoint.testing == mod.base_name:
+                        # Interrupted partway, some rows may be committed already
+                        self.clear_tables(mod.base_name)
+                    checkpoint.testing = mod.base_name
+                    checkpoint.save()
+                logger.debug('Adding test values for %s', mod.base_name)
+                mod.test_models()
+                if checkpoint is not None:
+                    checkpoint.tested.append(mod.base_name)
+                    checkpoint.testing = None
+                    checkpoint.save()
+            self.progress(i / count_loaders)
+
+    def index(self):
+        # Secondary indexes are created once the data is loaded
+        if not self.created or self.indexed:
+            return
+        logger.debug('Creating indexes...')
+        schema.apply_statements(self.script.indexes)
+        self.indexed = True
+        if self.checkpoint is not None:
+            self.checkpoint.indexed = True
+            self.checkpoint.save()
+
+    def done(self):
+        self.index()
+        if self.checkpoint is not None:
+            # Nothing left to resume, the next run starts over
+            self.checkpoint.reset()
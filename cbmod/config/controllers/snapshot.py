@@ -0,0 +1,101 @@
+import os
+import marshal
+import hashlib
+import ConfigParser
+
+import cbpos
+
+logger = cbpos.get_logger(__name__)
+
+from cbmod.config.controllers.files import atomic_write
+
+FORMAT = 2
+EXTENSION = '.snapshot'
+
+def snapshot_filename(filename):
+    return filename + EXTENSION
+
+def fingerprint(filename):
+    """
+    (mtime, size, sha1) of a config file.
+    """
+    stat = os.stat(filename)
+    with open(filename, 'rb') as f:
+        digest = hashlib.sha1(f.read()).hexdigest()
+    return (stat.st_mtime, stat.st_size, digest)
+
+def parse(filename):
+    """
+    Parse a config file into a dict of {section: {option: value}}.
+    Raises IOError, ConfigParser.Error or UnicodeDecodeError.
+    """
+    parser = ConfigParser.RawConfigParser()
+    with open(filename, 'rb') as f:
+        parser.readfp(f, filename)
+    data = {}
+    for section_name in parser.sections():
+        data[section_name] = dict((option, value.decode('utf-8'))
+                                  for option, value in parser.items(section_name))
+    return data
+
+def load(filename):
+    """
+    The parsed config stored in the snapshot of the config file, or None
+    if there is no valid snapshot.
+    """
+    try:
+        with open(snapshot_filename(filename), 'rb') as f:
+            header, data = marshal.load(f)
+    except (IOError, OSError, EOFError, ValueError, TypeError):
+        return None
+
+    try:
+        version, mtime, size, digest = header
+        stat = os.stat(filename)
+    except (ValueError, TypeError, OSError):
+        return None
+
+    # The cheap checks first, the file is only hashed when they match
+    if version != FORMAT or stat.st_mtime != mtime or stat.st_size != size:
+        return None
+    if fingerprint(filename)[2] != digest:
+        return None
+    return data
+
+def write(filename, data):
+    """
+    Atomically replace the snapshot of the config file with the given data.
+    """
+    target = snapshot_filename(filename)
+    try:
+        atomic_write(target, marshal.dumps(((FORMAT,) + fingerprint(filename), data)))
+    except ValueError:
+        logger.warn('Config snapshot not written, a value cannot be serialized')
+        return False
+    except (IOError, OSError):
+        logger.exception('Could not write config snapshot %s', target)
+        return False
+    return True
+
+def load_or_parse(filename):
+    """
+    The parsed config from its snapshot when valid, otherwise from the
+    file itself, in which case the snapshot is regenerated.
+    """
+    data = load(filename)
+    if data is None:
+        logger.debug('Config snapshot of %s is missing or stale', filename)
+        data = parse(filename)
+        write(filename, data)
+    return data
+
+def refresh(filename):
+    """
+    Regenerate the snapshot after the config file was saved.
+    """
+    try:
+        data = parse(filename)
+    except (IOError, ConfigParser.Error, UnicodeDecodeError):
+        logger.exception('Could not parse %s for its snapshot', filename)
+        return False
+    return write(filename, data)
@@ -0,0 +1,156 @@
+import json
+import time
+import random
+import socket
+import urllib
+import urllib2
+
+import cbpos
+
+logger = cbpos.get_logger(__name__)
+
+from cbmod.config.controllers.files import atomic_write
+from cbmod.config.controllers.writer import keep_base, save_config
+
+class SyncError(Exception):
+    pass
+
+class SyncState(object):
+    """
+    The ETags of the index and of every section last pulled, and the
+    options pulled in every section, kept in <config file>.sync.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.index = None
+        self.sections = {}
+        self.options = {}
+        try:
+            with open(filename, 'rb') as f:
+                data = json.loads(f.read().decode('utf-8'))
+        except (IOError, ValueError):
+            return
+        self.index = data.get('index')
+        self.sections = data.get('sections', {})
+        self.options = data.get('options', {})
+
+    def forget(self, name):
+        self.sections.pop(name, None)
+        self.options.pop(name, None)
+
+    def save(self):
+        atomic_write(self.filename, json.dumps({'index': self.index, 'sections': self.sections,
+                                                'options': self.options}).encode('utf-8'))
+
+class SyncClient(object):
+    """
+    Pulls the config sections of this terminal from a config server.
+
+    A pull costs one conditional request for the section index, and when
+    it changed, one batched request for the sections whose ETag differs.
+    The changed sections are merged into cbpos.config and saved once.
+    Sections and options the server dropped are removed, as long as they
+    were pulled from it; local sections it never served are left alone.
+
+    Server errors and throttling (429, 503 with Retry-After) are retried
+    with exponential backoff and jitter, so that a fleet of terminals does
+    not hammer the server in lockstep.
+    """
+
+    def __init__(self, url, terminal, retries=5, backoff=1.0, max_backoff=300.0, timeout=30):
+        self.url = url.rstrip('/')
+        self.terminal = terminal
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.state = SyncState(cbpos.config.filename + '.sync')
+
+    def request(self, path, etag=None):
+        """
+        GET a JSON document. Returns (data, etag), data is None when not modified.
+        """
+        url = '{}/config/{}/{}'.format(self.url, urllib.quote(self.terminal, ''), path)
+        delay = self.backoff
+        for attempt in xrange(self.retries + 1):
+            req = urllib2.Request(url, headers={'Accept': 'application/json'})
+            if etag:
+                req.add_header('If-None-Match', etag)
+            try:
+                response = urllib2.urlopen(req, timeout=self.timeout)
+                try:
+                    return json.loads(response.read().decode('utf-8')), response.info().getheader('ETag')
+                finally:
+                    response.close()
+            except urllib2.HTTPError as e:
+                if e.code == 304:
+                    return None, etag
+                if e.code not in (429, 500, 502, 503, 504):
+                    raise SyncError('{} returned {} {}'.format(url, e.code, e.msg))
+                retry_after = e.info().getheader('Retry-After')
+                error = e
+            except (urllib2.URLError, socket.error, ValueError) as e:
+                retry_after = None
+                error = e
+            if attempt == self.retries:
+                break
+            try:
+                wait = float(retry_after)
+            except (TypeError, ValueError):
+                wait = delay * random.uniform(0.5, 1.5)
+            logger.info('Config server unavailable (%s), retrying in %.1fs', error, wait)
+            time.sleep(wait)
+            delay = min(delay * 2, self.max_backoff)
+        raise SyncError('Could not reach {}: {}'.format(url, error))
+
+    def pull(self):
+        """
+        Pull and merge the changed sections, remove the dropped ones.
+        Returns the names of the sections changed or removed.
+        """
+        index, index_etag = self.request('index', self.state.index)
+        if index is None:
+            logger.debug('Config index not modified')
+            return []
+
+        changed = [name for name, etag in index['sections'].iteritems()
+                   if self.state.sections.get(name) != etag]
+        removed = [name for name in self.state.sections if name not in index['sections']]
+        sections = {}
+        if changed:
+            query = urllib.urlencode({'names': ','.join(sorted(changed))})
+            sections, _ = self.request('sections?' + query)
+        if changed or removed:
+            keep_base()
+            for name, section in sections.iteritems():
+                options = section['options']
+                for option in self.state.options.get(name, []):
+                    if option not in options:
+                        logger.info('Removing config option %s/%s, dropped by the server', name, option)
+                        cbpos.config[name, option] = None
+                for option, value in options.iteritems():
+                    cbpos.config[name, option] = value
+                self.state.sections[name] = section['etag']
+                self.state.options[name] = sorted(options)
+            for name in removed:
+                logger.info('Removing config section %s, dropped by the server', name)
+                cbpos.config[name] = None
+                self.state.forget(name)
+            save_config()
+            logger.info('Pulled %d config sections, removed %d: %s', len(changed), len(removed),
+                        ', '.join(sorted(changed + removed)))
+
+        self.state.index = index_etag
+        self.state.save()
+        return sorted(changed + removed)
+
+def run(url=None, terminal=None, spread=0):
+    url = url or cbpos.config['mod.config', 'sync_url']
+    if not url:
+        raise SyncError('No config server, set mod.config/sync_url or pass --url')
+    terminal = terminal or cbpos.config['mod.config', 'sync_terminal'] or socket.gethostname()
+    if spread:
+        # Spread the pulls of a fleet started at the same time
+        time.sleep(random.uniform(0, spread))
+    return SyncClient(url, terminal).pull()
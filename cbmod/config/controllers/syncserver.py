@@ -0,0 +1,124 @@
+"""
+Reference config server for the config sync, to test it offline.
+
+Sections are JSON files of {option: value} in the served directory:
+
+    <root>/default/<section>.json              sections of every terminal
+    <root>/terminals/<terminal>/<section>.json overrides for one terminal
+
+Run with:
+
+    python -m cbmod.config.controllers.syncserver --root DIR [--port 8470]
+"""
+import os
+import sys
+import json
+import hashlib
+import argparse
+import threading
+import urlparse
+import BaseHTTPServer
+import SocketServer
+
+def etag(data):
+    return '"{}"'.format(hashlib.sha1(data).hexdigest())
+
+class ConfigStore(object):
+    def __init__(self, root):
+        self.root = root
+
+    def sections(self, terminal):
+        """
+        {section: raw JSON} of a terminal, terminal overrides replacing the defaults.
+        """
+        sections = {}
+        for directory in (os.path.join(self.root, 'default'),
+                          os.path.join(self.root, 'terminals', terminal)):
+            if not os.path.isdir(directory):
+                continue
+            for filename in os.listdir(directory):
+                name, ext = os.path.splitext(filename)
+                if ext != '.json':
+                    continue
+                with open(os.path.join(directory, filename), 'rb') as f:
+                    sections[name] = f.read()
+        return sections
+
+class ConfigRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlparse.urlparse(self.path)
+        parts = [p for p in url.path.split('/') if p]
+        if len(parts) != 3 or parts[0] != 'config':
+            return self.send_error(404)
+
+        terminal = urlparse.unquote(parts[1])
+        if not terminal or '..' in terminal or any(sep in terminal for sep in ('/', '\\', os.sep)):
+            # The terminal name is joined into a path of the served directory
+            return self.send_error(400)
+
+        if not self.server.acquire():
+            # Ask the terminals to come back later instead of queuing them
+            self.send_response(503)
+            self.send_header('Retry-After', str(self.server.retry_after))
+            self.end_headers()
+            return
+        try:
+            resource = parts[2]
+            sections = self.server.store.sections(terminal)
+            if resource == 'index':
+                body = json.dumps({'sections': dict((n, etag(d)) for n, d in sections.iteritems())},
+                                  sort_keys=True)
+            elif resource == 'sections':
+                names = urlparse.parse_qs(url.query).get('names', [''])[0].split(',')
+                body = json.dumps(dict((n, {'etag': etag(sections[n]), 'options': json.loads(sections[n])})
+                                       for n in names if n in sections), sort_keys=True)
+            else:
+                return self.send_error(404)
+            self.send_json(body)
+        finally:
+            self.server.release()
+
+    def send_json(self, body):
+        tag = etag(body)
+        if self.headers.getheader('If-None-Match') == tag:
+            self.send_response(304)
+            self.send_header('ETag', tag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', tag)
+        self.end_headers()
+        self.wfile.write(body)
+
+class ConfigServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, root, max_clients=32, retry_after=5):
+        BaseHTTPServer.HTTPServer.__init__(self, address, ConfigRequestHandler)
+        self.store = ConfigStore(root)
+        self.retry_after = retry_after
+        self.__slots = threading.BoundedSemaphore(max_clients)
+
+    def acquire(self):
+        return self.__slots.acquire(False)
+
+    def release(self):
+        self.__slots.release()
+
+def main():
+    parser = argparse.ArgumentParser(description="Coinbox reference config server")
+    parser.add_argument('--root', required=True, help="Directory of the served sections")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8470)
+    parser.add_argument('--max-clients', type=int, default=32,
+                        help="Concurrent requests served before answering 503")
+    args = parser.parse_args()
+
+    server = ConfigServer((args.host, args.port), args.root, args.max_clients)
+    sys.stdout.write('Serving {} on http://{}:{}/\n'.format(args.root, args.host, args.port))
+    server.serve_forever()
+
+if __name__ == '__main__':
+    main()
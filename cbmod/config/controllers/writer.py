@@ -0,0 +1,220 @@
+from PySide import QtCore
+
+import os
+import copy
+import atexit
+import threading
+
+import cbpos
+
+logger = cbpos.get_logger(__name__)
+
+from cbmod.config.controllers import history, snapshot
+from cbmod.config.controllers.history import get_history
+from cbmod.config.controllers.profiling import profiled
+
+_base = None
+
+def keep_base():
+    """
+    Keep a copy of cbpos.config as it was loaded, before anything changes
+    it. The history starts with it, so that the first save can be rolled
+    back too. Called when the writer starts and before a sync.
+    """
+    global _base
+    if _base is None:
+        _base = history.dump(cbpos.config)
+
+def before_save():
+    if _base is not None and get_history().head()[0] == 0:
+        get_history().record(_base)
+
+def after_save(config):
+    snapshot.refresh(config.filename)
+    version = get_history().record(history.dump(config))
+    if version is not None:
+        logger.debug('Config saved as version %d', version)
+
+def save_config(config=None):
+    """
+    Save `config` (default: cbpos.config), refresh its snapshot and record
+    it in the history.
+    This blocks, the GUI submits its saves to the ConfigWriter instead.
+    """
+    config = config if config is not None else cbpos.config
+    before_save()
+    config.save()
+    after_save(config)
+
+def save_defaults(overwrite=False, config=None):
+    config = config if config is not None else cbpos.config
+    before_save()
+    config.save_defaults(overwrite=overwrite)
+    after_save(config)
+
+class SaveWatcher(QtCore.QObject):
+    """
+    Calls back on the GUI thread once a submitted save is written or failed.
+    """
+    
+    def __init__(self, writer, finished=None, error=None):
+        super(SaveWatcher, self).__init__()
+        self.writer = writer
+        self.ticket = None
+        self.finished = finished
+        self.error = error
+        writer.saveFinished.connect(self.onSaveFinished)
+        writer.saveError.connect(self.onSaveError)
+    
+    def onSaveFinished(self, ticket):
+        if self.ticket is None or ticket < self.ticket:
+            return
+        self.done()
+        if self.finished is not None:
+            self.finished()
+    
+    def onSaveError(self, ticket, exception):
+        if self.ticket is None or ticket < self.ticket:
+            return
+        self.done()
+        if self.error is not None:
+            self.error(exception)
+    
+    def done(self):
+        self.writer.saveFinished.disconnect(self.onSaveFinished)
+        self.writer.saveError.disconnect(self.onSaveError)
+        self.writer.watchers.discard(self)
+
+class ConfigWriter(QtCore.QThread):
+    """
+    Saves cbpos.config off the GUI thread.
+
+    submit() takes a copy of cbpos.config on the calling thread, the one
+    that changes it, queues it and returns a ticket. Saves submitted within
+    `delay` seconds of each other are coalesced into a single write, which
+    is fsynced; saveFinished is then emitted with the last ticket written,
+    or saveError with the last ticket and the exception. Pending saves are
+    flushed when the application quits.
+    """
+    
+    saveFinished = QtCore.Signal(int)
+    saveError = QtCore.Signal(int, object)
+    defaultsSaved = QtCore.Signal(object)
+    
+    SAVE, DEFAULTS, DEFAULTS_OVERWRITE = range(3)
+    
+    def __init__(self, delay=0.2, parent=None):
+        super(ConfigWriter, self).__init__(parent)
+        self.delay = delay
+        self.watchers = set()
+        self.__condition = threading.Condition()
+        self.__pending = []
+        self.__ticket = 0
+        self.__busy = False
+        self.__flushing = False
+        self.__running = True
+        # The writer object lives on the GUI thread, the defaults are
+        # brought to the live config there
+        self.defaultsSaved.connect(self.applyDefaults, QtCore.Qt.QueuedConnection)
+    
+    def submit(self, operation=SAVE, finished=None, error=None):
+        """
+        Queue a save of cbpos.config as it is now. `finished` is called
+        once it is written, `error` with the exception if it failed.
+        """
+        config = copy.deepcopy(cbpos.config)
+        # Connected before the save is queued, so that its signals are not missed
+        watcher = SaveWatcher(self, finished, error) if finished is not None or error is not None else None
+        with self.__condition:
+            self.__ticket += 1
+            ticket = self.__ticket
+            self.__pending.append((operation, config))
+            self.__condition.notify_all()
+        if watcher is not None:
+            watcher.ticket = ticket
+            self.watchers.add(watcher)
+        return ticket
+    
+    def run(self):
+        while True:
+            with self.__condition:
+                while not self.__pending and self.__running:
+                    self.__condition.wait()
+                if not self.__pending:
+                    return
+                # Let the saves coming in quickly pile up
+                while self.__running and not self.__flushing:
+                    count = len(self.__pending)
+                    self.__condition.wait(self.delay)
+                    if len(self.__pending) == count:
+                        break
+                operations, self.__pending = self.__pending, []
+                ticket = self.__ticket
+                self.__busy = True
+            try:
+                self.write(operations)
+            except Exception as e:
+                logger.exception('Could not save the configuration')
+                self.saveError.emit(ticket, e)
+            else:
+                self.saveFinished.emit(ticket)
+            finally:
+                with self.__condition:
+                    self.__busy = False
+                    self.__condition.notify_all()
+    
+    @profiled('config-write')
+    def write(self, operations):
+        # Consecutive plain saves are one and the same write, of the last copy
+        coalesced = [(op, config) for i, (op, config) in enumerate(operations)
+                     if op != self.SAVE or i + 1 == len(operations) or operations[i + 1][0] != self.SAVE]
+        logger.debug('Writing configuration (%d saves coalesced into %d)', len(operations), len(coalesced))
+        for operation, config in coalesced:
+            if operation == self.SAVE:
+                save_config(config)
+            else:
+                before = history.dump(config)
+                save_defaults(overwrite=(operation == self.DEFAULTS_OVERWRITE), config=config)
+                self.defaultsSaved.emit(history.diff(before, history.dump(config)))
+        with open(config.filename, 'ab') as f:
+            os.fsync(f.fileno())
+    
+    def applyDefaults(self, delta):
+        # The defaults were set on the copy, bring them to the live config
+        history.apply_delta(delta)
+    
+    def flush(self):
+        """
+        Block until every submitted save is written.
+        """
+        with self.__condition:
+            self.__flushing = True
+            self.__condition.notify_all()
+            while (self.__pending or self.__busy) and self.isRunning():
+                self.__condition.wait(0.1)
+            self.__flushing = False
+    
+    def stop(self):
+        self.flush()
+        with self.__condition:
+            self.__running = False
+            self.__condition.notify_all()
+        self.wait()
+
+_writer = None
+
+def get_writer():
+    """
+    The running config writer, started on first use. Editors get it before
+    they change cbpos.config.
+    """
+    global _writer
+    if _writer is None:
+        keep_base()
+        _writer = ConfigWriter()
+        _writer.start()
+        app = QtCore.QCoreApplication.instance()
+        if app is not None:
+            app.aboutToQuit.connect(_writer.stop)
+        atexit.register(_writer.stop)
+    return _writer
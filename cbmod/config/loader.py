@@ -1,3 +1,5 @@
+import sys
+
 from pydispatch import dispatcher
 
 import cbpos
@@ -21,19 +23,68 @@ class ModuleLoader(BaseModuleLoader):
     
     def load_argparsers(self):
         parser1 = cbpos.subparsers.add_parser('config', description="Run qtPos database configuration")
+        parser1.add_argument('--provision', nargs='+', metavar='PROFILE',
+                             help="Rebuild the databases of these profiles from scratch, without interface")
+        parser1.add_argument('--jobs', type=int, metavar='N',
+                             help="Profiles provisioned at the same time (default: number of CPUs)")
+        parser1.add_argument('--no-test', dest='test', action='store_false',
+                             help="Do not insert test values when provisioning")
         parser1.set_defaults(handle=self.run_config)
         
         parser2 = cbpos.subparsers.add_parser('raw-config', description="Run qtPos raw configuration editor")
         parser2.set_defaults(handle=self.run_raw_config)
+        
+        for parser in (parser1, parser2):
+            parser.add_argument('--profiling', choices=('cprofile', 'sample', 'both'),
+                                help="Capture a profile of every configuration phase")
+            parser.add_argument('--profiling-dir', metavar='DIR',
+                                help="Directory where the profiles are written")
+            parser.add_argument('--instrument', action='store_true',
+                                help="Measure widgets, objects and memory of the configuration pages")
+        
+        parser3 = cbpos.subparsers.add_parser('config-sync', description="Pull the configuration from the config server")
+        parser3.add_argument('--url', help="Config server URL (default: mod.config/sync_url)")
+        parser3.add_argument('--terminal', help="Terminal name (default: mod.config/sync_terminal or the host name)")
+        parser3.add_argument('--spread', type=float, default=0, metavar='SECONDS',
+                             help="Wait a random delay up to SECONDS before pulling")
+        parser3.set_defaults(handle=self.run_config_sync)
+        
+        parser4 = cbpos.subparsers.add_parser('config-audit', description="Compare the configuration files of many terminals")
+        parser4.add_argument('paths', nargs='+', metavar='PATH', help="Config files, or directories of config files")
+        parser4.add_argument('--jobs', type=int, metavar='N', help="Parsing processes (default: number of CPUs)")
+        against = parser4.add_mutually_exclusive_group()
+        against.add_argument('--reference', metavar='FILE', help="Compare with this config file instead of the majority")
+        against.add_argument('--defaults', action='store_true', help="Compare with the defaults of the modules")
+        parser4.set_defaults(handle=self.run_config_audit)
+    
+    def configure_profiling(self, args):
+        if args.profiling:
+            from cbmod.config.controllers.profiling import profiler
+            profiler.configure(args.profiling, args.profiling_dir)
+        if args.instrument:
+            from cbmod.config.controllers.instrument import instrument
+            instrument.configure(True, cbpos.config['mod.config', 'instrument_widget_budget'])
 
     def run_config(self, args):
         logger.info('Running database configuration...')
         
+        self.configure_profiling(args)
+        
+        if args.provision:
+            self.run_provision(args)
+        
         cbpos.loader.autoload_database(False)
         cbpos.loader.autoload_interface(False)
         
         dispatcher.connect(self.do_run_config, signal='ui-post-init', sender=dispatcher.Any)
     
+    def run_provision(self, args):
+        from cbmod.config.controllers import provision
+        
+        results = provision.provision(args.provision, args.jobs, args.test)
+        provision.write_summary(results)
+        sys.exit(1 if any(r['error'] for r in results) else 0)
+    
     def do_run_config(self):
         # Prompt the user to change database configuration
         from cbmod.config.views.dialogs import DatabaseConfigDialog
@@ -43,6 +94,8 @@ class ModuleLoader(BaseModuleLoader):
     def run_raw_config(self, args):
         logger.info('Running raw configuration...')
         
+        self.configure_profiling(args)
+        
         cbpos.loader.autoload_translation(False)
         cbpos.loader.autoload_database(False)
         cbpos.loader.autoload_interface(False)
@@ -55,6 +108,42 @@ class ModuleLoader(BaseModuleLoader):
         win = RawConfigDialog()
         cbpos.ui.chain_window(win, cbpos.ui.PRIORITY_FIRST_HIGHEST)
     
+    def run_config_sync(self, args):
+        from cbmod.config.controllers import sync
+        
+        logger.info('Pulling configuration...')
+        try:
+            changed = sync.run(args.url, args.terminal, args.spread)
+        except sync.SyncError as e:
+            logger.error('Configuration pull failed: %s', e)
+            sys.exit(1)
+        logger.info('%d configuration sections updated', len(changed))
+        sys.exit(0)
+    
+    def run_config_audit(self, args):
+        from cbmod.config.controllers import audit
+        
+        if args.reference:
+            reference, _, error = audit.parse(args.reference)
+            if error is not None:
+                logger.error('Could not parse %s: %s', args.reference, error)
+                sys.exit(1)
+        elif args.defaults:
+            reference = audit.defaults()
+        else:
+            reference = None
+        
+        try:
+            terminals = audit.collect(args.paths)
+        except audit.AuditError as e:
+            logger.error('Configuration audit failed: %s', e)
+            sys.exit(1)
+        
+        fleet = audit.FleetAudit(reference, partial=args.defaults)
+        fleet.run(terminals, args.jobs)
+        fleet.write_report()
+        sys.exit(0)
+    
     def first_run_wizard_pages(self):
         from cbmod.base.views.wizard import WizardPageCollection
         from cbmod.config.views.wizard import DatabaseInfoWizardPage, DatabaseProfileConfigWizardPage, DatabaseSetupWizardPage
@@ -8,4 +8,18 @@ class ModuleMetadata(BaseModuleMetadata):
     dependencies = (
         ('base', '0.1'),
     )
-    config_defaults = tuple()
+    config_defaults = (
+        ('mod.config', {
+            # Profile the config pages and setup phases: cprofile, sample or both
+            'profile': '',
+            'profile_dir': '',
+            # Central config server, the terminal name defaults to the host name
+            'sync_url': '',
+            'sync_terminal': '',
+            # Versions between two full copies of the config in its history
+            'history_checkpoint_interval': '50',
+            # Measure widgets, objects and memory of the config pages
+            'instrument': '',
+            'instrument_widget_budget': '',
+        }),
+    )
@@ -1,14 +1,22 @@
 from PySide import QtGui
 
-import cbpos
-
 from cbmod.base.views import BasePage
+from cbmod.config.controllers.registry import config_pages
+from cbmod.config.controllers.profiling import profiled
+from cbmod.config.controllers.writer import get_writer
+from cbmod.config.controllers.instrument import instrument, instrumented
 
 class MainConfigPage(BasePage):
     def __init__(self):
         super(MainConfigPage, self).__init__()
         
         self.tabs = QtGui.QTabWidget()
+        self.tabs.currentChanged.connect(self.onTabChanged)
+        
+        self.writer = get_writer()
+        
+        # Tab index -> registry entry of the pages not instantiated yet
+        self.pending = {}
         
         buttonBox = QtGui.QDialogButtonBox()
         
@@ -26,29 +34,66 @@ class MainConfigPage(BasePage):
         
         self.setLayout(layout)
     
+    @instrumented('MainConfigPage', 'populate')
+    @profiled('config-populate')
     def populate(self):
-        for mod in cbpos.modules.all_loaders():
-            try:
-                pages = mod.config_pages()
-            except AttributeError:
-                continue
-            for page_class in pages:
-                page = page_class()
-                label = page.label if hasattr(page, 'label') and page.label else '[%s]' % (mod.name,)
-                self.tabs.addTab(page, label)
-                page.populate()
+        if self.tabs.count():
+            # Shown again, refresh the pages instead of adding their tabs again
+            for index, page in self.loadedPages():
+                instrument.measure(self, self.tabs.tabText(index), 'populate', page.populate)
+            return
+        # Only the page shown is imported and instantiated, the others are
+        # loaded the first time their tab is selected
+        for entry in config_pages.entries():
+            index = self.tabs.addTab(QtGui.QWidget(), entry.label)
+            self.pending[index] = entry
+        self.onTabChanged(self.tabs.currentIndex())
     
-    def onOkButton(self):
+    def onTabChanged(self, index):
+        entry = self.pending.pop(index, None)
+        if entry is None:
+            return
+        instrument.measure(self, entry.label, 'populate', self.loadPage, index, entry)
+    
+    def loadPage(self, index, entry):
+        page = entry.load()()
+        placeholder = self.tabs.widget(index)
+        self.tabs.blockSignals(True)
+        self.tabs.removeTab(index)
+        label = page.label if hasattr(page, 'label') and page.label else entry.label
+        self.tabs.insertTab(index, page, label)
+        self.tabs.setCurrentIndex(index)
+        self.tabs.blockSignals(False)
+        placeholder.deleteLater()
+        page.populate()
+    
+    def hideEvent(self, event):
+        super(MainConfigPage, self).hideEvent(event)
+        if instrument.enabled:
+            instrument.closed('MainConfigPage')
+    
+    def loadedPages(self):
         for i in xrange(self.tabs.count()):
-            tab = self.tabs.widget(i)
-            tab.update()
-        cbpos.config.save()
+            if i not in self.pending:
+                yield i, self.tabs.widget(i)
+    
+    @instrumented('MainConfigPage', 'save')
+    @profiled('config-save')
+    def onOkButton(self):
+        for index, tab in self.loadedPages():
+            instrument.measure(self, self.tabs.tabText(index), 'save', tab.update)
+        self.writer.submit(finished=self.onSaveFinished, error=self.onSaveError)
+    
+    def onSaveFinished(self):
         QtGui.QMessageBox.information(self, 'Configuration',
             "Configuration changes are saved.", QtGui.QMessageBox.Ok)
     
+    def onSaveError(self, exception):
+        QtGui.QMessageBox.warning(self, 'Configuration',
+            "Configuration changes could not be saved:\n{}".format(exception), QtGui.QMessageBox.Ok)
+    
     def onCancelButton(self):
-        for i in xrange(self.tabs.count()):
-            tab = self.tabs.widget(i)
+        for _, tab in self.loadedPages():
             tab.populate()
         QtGui.QMessageBox.information(self, 'Configuration',
             "Configuration changes are canceled.", QtGui.QMessageBox.Ok)
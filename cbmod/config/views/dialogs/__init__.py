@@ -1,2 +1,3 @@
 from .database import DatabaseConfigDialog
-from .raw import RawConfigDialog
\ No newline at end of file
+from .raw import RawConfigDialog
+from .history import ConfigHistoryDialog
\ No newline at end of file
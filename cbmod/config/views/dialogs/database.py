@@ -1,14 +1,9 @@
 from PySide import QtGui, QtCore
 
-import Queue
-from sqlalchemy import exc
-
 import cbpos
-from cbpos.database import Profile, Driver, \
-                        ProfileNotFoundError, DriverNotFoundError
 
-from cbmod.base.views.wizard import BaseWizard, BaseWizardPage
-from cbmod.config.views.wizard import DatabaseInfoWizardPage, DatabaseProfileConfigWizardPage, DatabaseSetupWizardPage
+from cbmod.base.views.wizard import BaseWizard
+from cbmod.config.controllers.instrument import instrument
 
 logger = cbpos.get_logger(__name__)
 
@@ -16,6 +11,10 @@ class DatabaseConfigDialog(BaseWizard):
     def __init__(self, parent=None, flags=0):
         super(DatabaseConfigDialog, self).__init__(parent, flags)
         
+        # The wizard pages pull in SQLAlchemy and the database drivers,
+        # only import them when the dialog is actually opened
+        from cbmod.config.views.wizard import DatabaseInfoWizardPage, DatabaseProfileConfigWizardPage, DatabaseSetupWizardPage
+        
         self.setWindowTitle(cbpos.tr.config_("Coinbox Database Setup"))
         
         self.__info_page = DatabaseInfoWizardPage(self)
@@ -28,3 +27,8 @@ class DatabaseConfigDialog(BaseWizard):
         self.__setup_page = DatabaseSetupWizardPage(self)
         self.__setup_page.pageId = self.addPage(self.__setup_page)
         self.__info_page.setupPageId = self.__setup_page.pageId
+    
+    def hideEvent(self, event):
+        super(DatabaseConfigDialog, self).hideEvent(event)
+        if instrument.enabled:
+            instrument.closed('DatabaseConfigDialog')
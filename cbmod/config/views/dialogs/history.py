@@ -0,0 +1,78 @@
+from PySide import QtCore, QtGui
+
+import cbpos
+import time
+
+from cbmod.config.controllers import history
+from cbmod.config.controllers.writer import get_writer
+
+logger = cbpos.get_logger(__name__)
+
+class ConfigHistoryDialog(QtGui.QDialog):
+
+    def __init__(self, when_done=None):
+        super(ConfigHistoryDialog, self).__init__()
+
+        self.when_done = when_done if when_done is not None else lambda: None
+
+        self.history = history.get_history()
+
+        self.versions = QtGui.QListWidget()
+        self.versions.itemSelectionChanged.connect(self.onSelectionChanged)
+
+        buttonBox = QtGui.QDialogButtonBox()
+
+        self.restoreBtn = buttonBox.addButton("Restore", QtGui.QDialogButtonBox.AcceptRole)
+        self.restoreBtn.setEnabled(False)
+        self.restoreBtn.pressed.connect(self.onRestoreButton)
+
+        self.closeBtn = buttonBox.addButton(QtGui.QDialogButtonBox.Close)
+        self.closeBtn.pressed.connect(self.close)
+
+        layout = QtGui.QVBoxLayout()
+        layout.setSpacing(10)
+
+        layout.addWidget(self.versions)
+        layout.addWidget(buttonBox)
+
+        self.setLayout(layout)
+        self.setWindowTitle('Configuration History')
+
+        self.populate()
+
+    def populate(self):
+        self.versions.clear()
+        for entry in reversed(self.history.entries()):
+            text = 'Version {} - {}{}'.format(entry.version,
+                        time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(entry.timestamp)),
+                        ' (checkpoint)' if entry.kind == history.CHECKPOINT else '')
+            item = QtGui.QListWidgetItem(text)
+            item.setData(QtCore.Qt.UserRole, entry.version)
+            self.versions.addItem(item)
+
+    def onSelectionChanged(self):
+        self.restoreBtn.setEnabled(bool(self.versions.selectedItems()))
+
+    def onRestoreButton(self):
+        version = self.versions.currentItem().data(QtCore.Qt.UserRole)
+        reply = QtGui.QMessageBox.question(self, 'Configuration History',
+            "Restore the configuration of version {}?".format(version),
+            QtGui.QMessageBox.Yes | QtGui.QMessageBox.No)
+        if reply != QtGui.QMessageBox.Yes:
+            return
+
+        _, state = self.history.restore(version)
+        history.apply(state)
+        # The restored config is recorded as a new version, it can be undone too
+        self.setEnabled(False)
+        get_writer().submit(finished=self.onSaveFinished, error=self.onSaveError)
+        logger.info('Configuration restored to version %s', version)
+
+    def onSaveFinished(self):
+        self.close()
+        self.when_done()
+
+    def onSaveError(self, exception):
+        self.setEnabled(True)
+        QtGui.QMessageBox.warning(self, 'Configuration History',
+            "The restored configuration could not be saved:\n{}".format(exception), QtGui.QMessageBox.Ok)
@@ -3,6 +3,11 @@ from PySide import QtCore, QtGui
 import cbpos
 import sys
 
+from cbmod.config.controllers.profiling import profiled
+from cbmod.config.controllers.writer import get_writer, ConfigWriter
+from cbmod.config.controllers.instrument import instrument, instrumented
+from cbmod.config.views.dialogs.history import ConfigHistoryDialog
+
 logger = cbpos.get_logger(__name__)
 
 class RawConfigDialog(QtGui.QMainWindow):
@@ -17,6 +22,11 @@ class RawConfigDialog(QtGui.QMainWindow):
         
         self.setGeometry(300, 300, 350, 300)
         self.setWindowTitle('Raw Configuration Editor')
+    
+    def closeEvent(self, event):
+        super(RawConfigDialog, self).closeEvent(event)
+        if instrument.enabled:
+            instrument.closed('RawConfigDialog')
 
 class MainWidget(QtGui.QWidget):
     
@@ -37,6 +47,9 @@ class MainWidget(QtGui.QWidget):
         self.addBtn = buttonBox.addButton("Add", QtGui.QDialogButtonBox.ActionRole)
         self.addBtn.pressed.connect(self.onAddButton)
         
+        self.historyBtn = buttonBox.addButton("History", QtGui.QDialogButtonBox.ActionRole)
+        self.historyBtn.pressed.connect(self.onHistoryButton)
+        
         self.defaultsBtn = buttonBox.addButton("Defaults", QtGui.QDialogButtonBox.RejectRole)
         self.defaultsBtn.pressed.connect(self.onDefaultsButton)
         
@@ -57,36 +70,58 @@ class MainWidget(QtGui.QWidget):
         
         self.setLayout(layout)
     
+    @instrumented('RawConfigDialog', 'populate')
+    @profiled('raw-config-populate')
     def populate(self):
         index = self.tabs.currentIndex()
+        # QTabWidget.clear() only removes the tabs, delete their widgets too
+        tabs = [self.tabs.widget(i) for i in xrange(self.tabs.count())]
         self.tabs.clear()
+        for tab in tabs:
+            tab.deleteLater()
         for section_name, section in cbpos.config:
             self.tabs.addTab(SectionTab(section), section_name)
         
         if index<self.tabs.count():
             self.tabs.setCurrentIndex(index)
     
-    def save(self):
+    @instrumented('RawConfigDialog', 'save')
+    @profiled('raw-config-save')
+    def save(self, finished=None):
         for i in xrange(self.tabs.count()):
             self.tabs.widget(i).save()
-        cbpos.config.save()
+        get_writer().submit(finished=finished, error=self.onSaveError)
+    
+    def onSaveError(self, exception):
+        self.setEnabled(True)
+        QtGui.QMessageBox.warning(self, 'Raw Configuration',
+            "Configuration changes could not be saved:\n{}".format(exception), QtGui.QMessageBox.Ok)
     
     def onTabRemoved(self, index):
         section_name = self.tabs.tabText(index)
         cbpos.config[section_name] = None
+        tab = self.tabs.widget(index)
         self.tabs.removeTab(index)
+        tab.deleteLater()
     
     def onDefaultsButton(self):
-        cbpos.config.save_defaults(overwrite=True)
-        self.parent().close()
+        # Closed once the defaults are written, left open if they cannot be
+        self.setEnabled(False)
+        get_writer().submit(ConfigWriter.DEFAULTS_OVERWRITE,
+                            finished=self.parent().close, error=self.onSaveError)
     
     def onAddButton(self):
         dlg = AddOptionDialog(when_done=self.populate)
         dlg.exec_()
     
+    def onHistoryButton(self):
+        dlg = ConfigHistoryDialog(when_done=self.populate)
+        dlg.exec_()
+    
     def onOkButton(self):
-        self.save()
-        self.parent().close()
+        # Closed once the changes are written, left open if they cannot be
+        self.setEnabled(False)
+        self.save(finished=self.parent().close)
     
     def onApplyButton(self):
         self.save()
@@ -202,12 +237,21 @@ class AddOptionDialog(QtGui.QDialog):
         
         self.setLayout(form)
     
+    @profiled('raw-config-add-option')
     def onOkButton(self):
         section, option, value = [field.text() for field in (self.section, self.option, self.value)]
         cbpos.config[section, option] = value
-        cbpos.config.save()
+        self.setEnabled(False)
+        get_writer().submit(finished=self.onSaveFinished, error=self.onSaveError)
+    
+    def onSaveFinished(self):
         self.close()
         self.when_done()
     
+    def onSaveError(self, exception):
+        self.setEnabled(True)
+        QtGui.QMessageBox.warning(self, 'Raw Configuration',
+            "The option could not be saved:\n{}".format(exception), QtGui.QMessageBox.Ok)
+    
     def onCancelButton(self):
         self.close()
@@ -1,11 +1,11 @@
 from PySide import QtCore, QtGui
 
-import Queue
 from sqlalchemy import exc
 
 import cbpos
 
-from cbpos.modules import all_loaders
+from cbmod.config.controllers.setup import SetupCheckpoint, SetupPipeline
+from cbmod.config.controllers.profiling import profiled
 
 logger = cbpos.get_logger(__name__)
 
@@ -95,6 +95,94 @@ class DriverForm(QtGui.QWidget):
         profile.save()
         return True
 
+class ProfileListModel(QtCore.QAbstractListModel):
+    """
+    List of profile names, handed to the views in batches as they scroll.
+    """
+    
+    BATCH = 50
+    
+    def __init__(self, parent=None):
+        super(ProfileListModel, self).__init__(parent)
+        self.names = []
+        self.fetched = 0
+    
+    def setNames(self, names):
+        self.beginResetModel()
+        self.names = names
+        self.fetched = 0
+        self.endResetModel()
+    
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else self.fetched
+    
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if not index.isValid() or index.row() >= self.fetched:
+            return None
+        if role in (QtCore.Qt.DisplayRole, QtCore.Qt.EditRole):
+            return self.names[index.row()]
+        return None
+    
+    def canFetchMore(self, parent=QtCore.QModelIndex()):
+        return not parent.isValid() and self.fetched < len(self.names)
+    
+    def fetchMore(self, parent=QtCore.QModelIndex(), count=None):
+        remaining = len(self.names) - self.fetched
+        count = min(remaining, count if count is not None else self.BATCH)
+        if count <= 0:
+            return
+        self.beginInsertRows(QtCore.QModelIndex(), self.fetched, self.fetched + count - 1)
+        self.fetched += count
+        self.endInsertRows()
+    
+    def fetchAll(self):
+        self.fetchMore(count=len(self.names) - self.fetched)
+
+class ProfilePicker(QtGui.QWidget):
+    """
+    Filterable combo box of the profile names in a ProfileIndex.
+    """
+    
+    def __init__(self, index, parent=None):
+        super(ProfilePicker, self).__init__(parent)
+        
+        self.index = index
+        
+        self.model = ProfileListModel(self)
+        self.proxy = QtGui.QSortFilterProxyModel(self)
+        self.proxy.setSourceModel(self.model)
+        self.proxy.setFilterCaseSensitivity(QtCore.Qt.CaseInsensitive)
+        
+        self.filter = QtGui.QLineEdit(self)
+        self.filter.setPlaceholderText(cbpos.tr.config_("Filter profiles..."))
+        self.filter.textChanged.connect(self.onFilterChanged)
+        
+        self.combo = QtGui.QComboBox(self)
+        self.combo.setEditable(False)
+        self.combo.setModel(self.proxy)
+        
+        layout = QtGui.QVBoxLayout()
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.addWidget(self.filter)
+        layout.addWidget(self.combo)
+        self.setLayout(layout)
+    
+    def reload(self):
+        # Profiles may have been added or removed elsewhere since last time
+        self.index.invalidate()
+        self.model.setNames(self.index.names())
+        self.model.fetchMore()
+        self.combo.setCurrentIndex(-1)
+    
+    def onFilterChanged(self, text):
+        if text:
+            # Filtering only sees the rows that were fetched
+            self.model.fetchAll()
+        self.proxy.setFilterFixedString(text)
+    
+    def currentProfile(self):
+        return self.index.get(self.combo.currentText())
+
 class DatabaseSetupWorker(QtCore.QThread):
     stateProgress = QtCore.Signal(int, float)
     stateError = QtCore.Signal(int, object)
@@ -103,18 +191,24 @@ class DatabaseSetupWorker(QtCore.QThread):
     STATE_NONE, STATE_INIT, STATE_LOAD, STATE_CREATE, STATE_TEST, STATE_DONE = range(6)
     START, FINISH, DONE = 0, 99, 100
     
+    STATE_NAMES = {STATE_INIT: 'init', STATE_LOAD: 'load', STATE_CREATE: 'create',
+                   STATE_TEST: 'test', STATE_DONE: 'done'}
+    
     class Communicator(QtCore.QObject):
         def __init__(self, worker):
             super(DatabaseSetupWorker.Communicator, self).__init__()
             self.worker = worker
         
+        @profiled(lambda self, state: 'setup-' + DatabaseSetupWorker.STATE_NAMES.get(state, str(state)))
         def runState(self, state):
             self.worker.stateProgress.emit(state, self.worker.START)
             
+            pipeline = self.worker.pipeline
+            pipeline.progress = lambda fraction: self.worker.stateProgress.emit(state, self.worker.FINISH * fraction)
+            
             if state == self.worker.STATE_INIT:
-                # Start the database AFTER potential changes in the configuration
                 try:
-                    cbpos.database.init()
+                    pipeline.init()
                 except (ImportError, exc.SQLAlchemyError) as e:
                     # Either the required db backend is not installed
                     # Or there is a database error (connection, etc.)
@@ -125,50 +219,49 @@ class DatabaseSetupWorker(QtCore.QThread):
                     self.worker.stateError.emit(state, e)
                     return
             elif state == self.worker.STATE_LOAD:
-                # Load database models of every module
                 try:
-                    loaders = all_loaders()
-                    count_loaders = float(len(loaders))
-                    for i, mod in enumerate(loaders):
-                        logger.debug('Loading DB models for %s', mod.base_name)
-                        models = mod.load_models()
-                        self.worker.stateProgress.emit(state, self.worker.FINISH * (i/count_loaders))
+                    pipeline.load()
                 except Exception as e:
                     self.worker.stateError.emit(state, e)
                     logger.exception("Could not load database")
                     return
             elif state == self.worker.STATE_CREATE:
-                # Flush the chosen database and recreate the structure
                 try:
-                    logger.debug('Clearing database...')
-                    cbpos.database.clear()
-                    self.worker.stateProgress.emit(state, self.worker.FINISH * 0.5)
-                    logger.debug('Creating database...')
-                    cbpos.database.create()
+                    pipeline.create()
                 except Exception as e:
                     self.worker.stateError.emit(state, e)
                     logger.exception("Could not create database tables")
                     return
             elif state == self.worker.STATE_TEST:
-                # Add initial testing values
                 try:
-                    loaders = all_loaders()
-                    count_loaders = float(len(loaders))
-                    for i, mod in enumerate(loaders):
-                        logger.debug('Adding test values for %s', mod.base_name)
-                        mod.test_models()
-                        self.worker.stateProgress.emit(state, self.worker.FINISH * (i/count_loaders))
+                    pipeline.test()
                 except Exception as e:
                     self.worker.stateError.emit(state, e)
                     logger.exception("Could not insert test database values")
                     return
+                self.worker.stateProgress.emit(state, self.worker.FINISH)
+                try:
+                    pipeline.index()
+                except Exception as e:
+                    self.worker.stateError.emit(state, e)
+                    logger.exception("Could not create database indexes")
+                    return
             elif state == self.worker.STATE_DONE:
+                try:
+                    pipeline.done()
+                except Exception as e:
+                    self.worker.stateError.emit(state, e)
+                    logger.exception("Could not create database indexes")
+                    return
                 self.worker.quit()
             
             self.worker.stateProgress.emit(state, self.worker.DONE)
     
-    def __init__(self, parent=None):
+    def __init__(self, parent=None, profile=None):
         super(DatabaseSetupWorker, self).__init__(parent)
+        # Without a profile the setup cannot be resumed
+        checkpoint = SetupCheckpoint(profile) if profile is not None else None
+        self.pipeline = SetupPipeline(checkpoint)
         self.on_main = DatabaseSetupWorker.Communicator(self)
         
         self.on_worker = DatabaseSetupWorker.Communicator(self)
@@ -4,10 +4,12 @@ import cbpos
 
 logger = cbpos.get_logger(__name__)
 
-from cbpos.database import Profile, Driver, ProfileNotFoundError, DriverNotFoundError
+from cbpos.database import Profile, Driver, DriverNotFoundError
 
 from cbmod.base.views.wizard import BaseWizardPage
-from cbmod.config.views.widgets.database import DriverForm, DatabaseSetupWorker
+from cbmod.config.views.widgets.database import DriverForm, DatabaseSetupWorker, ProfilePicker
+from cbmod.config.controllers import schema
+from cbmod.config.controllers.profiles import profiles
 
 class DatabaseInfoWizardPage(BaseWizardPage):
     
@@ -29,8 +31,8 @@ class DatabaseInfoWizardPage(BaseWizardPage):
         self.profileSelect.toggled.connect(self.onProfileSelectionToggled)
         self.profileEdit.toggled.connect(self.onProfileSelectionToggled)
         
-        self.profileCombo = QtGui.QComboBox(self.configureBox)
-        self.profileCombo.setEditable(False)
+        self.profilePicker = ProfilePicker(profiles, self.configureBox)
+        self.profileCombo = self.profilePicker.combo
         self.profileCombo.currentIndexChanged.connect(self.onProfileComboChanged)
         
         self.registerField('database_profile_new', self.profileNew)
@@ -44,7 +46,7 @@ class DatabaseInfoWizardPage(BaseWizardPage):
         configureLayout.addWidget(self.profileNew)
         configureLayout.addWidget(self.profileSelect)
         configureLayout.addWidget(self.profileEdit)
-        configureLayout.addWidget(self.profileCombo)
+        configureLayout.addWidget(self.profilePicker)
         self.configureBox.setLayout(configureLayout)
         
         layout = QtGui.QVBoxLayout()
@@ -55,37 +57,28 @@ class DatabaseInfoWizardPage(BaseWizardPage):
     
     def onProfileSelectionToggled(self):
         if self.profileNew.isChecked():
-            self.profileCombo.setEnabled(False)
+            self.profilePicker.setEnabled(False)
         elif self.profileEdit.isChecked() or self.profileSelect.isChecked():
-            self.profileCombo.setEnabled(True)
+            self.profilePicker.setEnabled(True)
         else:
-            self.profileCombo.setEnabled(False)
+            self.profilePicker.setEnabled(False)
         self.completeChanged.emit()
     
     def onProfileComboChanged(self):
         self.completeChanged.emit()
     
     def initializePage(self):
-        self.profileCombo.clear()
-        for p in Profile.get_all():
-            self.profileCombo.addItem(p.name, p)
-        self.profileCombo.setCurrentIndex(-1)
+        self.profilePicker.reload()
     
     def validatePage(self):
         if self.field('database_profile_new'):
             return True
         
-        selected_profile_name = self.field('database_profile_name')
-        if not selected_profile_name:
+        profile = self.profilePicker.currentProfile()
+        if profile is None:
             return False
-        
-        try:
-            profile = Profile.get(selected_profile_name)
-        except ProfileNotFoundError:
+        elif not profile.editable and self.field('database_profile_edit'):
             return False
-        else:
-            if not profile.editable and self.field('database_profile_edit'):
-                return False
         
         return True
     
@@ -119,24 +112,20 @@ class DatabaseProfileConfigWizardPage(BaseWizardPage):
         self.driverFormPanel.setCheckable(False)
         self.driverFormPanel.setFlat(False)
         
-        self.driverFormTabs = QtGui.QTabWidget(self.driverFormPanel)
-        self.driverFormTabs.setTabsClosable(False)
-        self.driverFormTabs.tabBar().setVisible(False)
+        self.driverFormStack = QtGui.QStackedWidget(self.driverFormPanel)
         
+        # Driver forms are only built when their driver is first selected
         self.driverForms = {}
         self.drivers = Driver.get_all()
         self.drivers.sort(key=lambda d: d.display)
-        for driver in self.drivers:
-            self.driverForms[driver.name] = form = DriverForm(driver, self)
-            self.driverFormTabs.addTab(form, driver.display)
-            self.driverChoice.addItem(driver.display)
-        
-        self.driverFormPanel.setTitle(self.drivers[0].display)
         
         panelLayout = QtGui.QVBoxLayout()
-        panelLayout.addWidget(self.driverFormTabs)
+        panelLayout.addWidget(self.driverFormStack)
         self.driverFormPanel.setLayout(panelLayout)
         
+        for driver in self.drivers:
+            self.driverChoice.addItem(driver.display)
+        
         layout = QtGui.QFormLayout()
         layout.addRow(cbpos.tr.config_("Profile Name"), self.profileText)
         layout.addRow(cbpos.tr.config_("Database Driver"), self.driverChoice)
@@ -144,11 +133,20 @@ class DatabaseProfileConfigWizardPage(BaseWizardPage):
         
         self.setLayout(layout)
     
+    def driverForm(self, driver):
+        try:
+            return self.driverForms[driver.name]
+        except KeyError:
+            self.driverForms[driver.name] = form = DriverForm(driver, self)
+            self.driverFormStack.addWidget(form)
+            return form
+    
     def onDriverChoiceChanged(self, index):
         self.current_driver = self.drivers[index]
         self.driverFormPanel.setTitle(self.current_driver.display)
-        self.driverForms[self.current_driver.name].clear()
-        self.driverFormTabs.setCurrentIndex(index)
+        form = self.driverForm(self.current_driver)
+        form.clear()
+        self.driverFormStack.setCurrentWidget(form)
     
     def initializePage(self):
         selected_profile_name = self.field('database_profile_name')
@@ -156,9 +154,8 @@ class DatabaseProfileConfigWizardPage(BaseWizardPage):
             return
         
         # Fill the form with the selected profile
-        try:
-            profile = Profile.get(selected_profile_name)
-        except ProfileNotFoundError:
+        profile = profiles.get(selected_profile_name)
+        if profile is None:
             logger.debug("Profile named {} was not found".format(selected_profile_name))
             self.wizard().back()
         else:
@@ -170,7 +167,7 @@ class DatabaseProfileConfigWizardPage(BaseWizardPage):
         self.driverChoice.setCurrentIndex(index)
         for form in self.driverForms.itervalues():
             form.clear()
-        self.driverForms[self.current_driver.name].setProfile(profile)
+        self.driverForm(self.current_driver).setProfile(profile)
         
         self.profileText.setText(selected_profile_name)
     
@@ -178,9 +175,8 @@ class DatabaseProfileConfigWizardPage(BaseWizardPage):
         selected_profile_name = self.field('database_profile_name')
         new_profile_name = self.field('database_profile_new_name')
         if selected_profile_name:
-            try:
-                selected_profile = Profile.get(selected_profile_name)
-            except ProfileNotFoundError:
+            selected_profile = profiles.get(selected_profile_name)
+            if selected_profile is None:
                 logger.debug("Profile named {} was not found".format(selected_profile_name))
                 return False
         else:
@@ -188,23 +184,18 @@ class DatabaseProfileConfigWizardPage(BaseWizardPage):
         
         if new_profile_name == selected_profile_name:
             profile = selected_profile
+        elif new_profile_name in profiles:
+            QtGui.QMessageBox.information(self, 'New Database Profile',
+                "A profile with this name already exists. Choose another name.", QtGui.QMessageBox.Ok)
+            return False
+        elif selected_profile:
+            profile = selected_profile
+            profile.name = new_profile_name
         else:
-            try:
-                profile = Profile.get(new_profile_name)
-            except ProfileNotFoundError:
-                if selected_profile:
-                    profile = selected_profile
-                    profile.name = new_profile_name
-                else:
-                    profile = Profile(name=new_profile_name, driver=self.current_driver)
-            except:
-                raise
-            else:
-                QtGui.QMessageBox.information(self, 'New Database Profile',
-                    "A profile with this name already exists. Choose another name.", QtGui.QMessageBox.Ok)
-                return False
+            profile = Profile(name=new_profile_name, driver=self.current_driver)
         
-        self.driverForms[self.current_driver.name].save(profile)
+        self.driverForm(self.current_driver).save(profile)
+        profiles.invalidate()
         profile.use()
         
         return True
@@ -259,6 +250,10 @@ class DatabaseSetupWizardPage(BaseWizardPage):
         self.buttonBox.accepted.connect(self.onPromptAccept)
         self.buttonBox.rejected.connect(self.onPromptReject)
         
+        self.exportBtn = QtGui.QPushButton(cbpos.tr.config_("Export SQL..."), self)
+        self.exportBtn.setEnabled(False)
+        self.exportBtn.pressed.connect(self.onExportButton)
+        
         questionLayout = QtGui.QVBoxLayout()
         questionLayout.addWidget(self.prompt)
         questionLayout.addWidget(self.buttonBox)
@@ -269,6 +264,7 @@ class DatabaseSetupWizardPage(BaseWizardPage):
         
         layout.addLayout(statesLayout)
         layout.addWidget(self.progress)
+        layout.addWidget(self.exportBtn, 0, QtCore.Qt.AlignRight)
         layout.addStretch(1)
         layout.addWidget(self.questionBox)
         
@@ -279,7 +275,11 @@ class DatabaseSetupWizardPage(BaseWizardPage):
     
     def initializePage(self):
         # self.field('database_configure') does not matter
-        self.worker = DatabaseSetupWorker()
+        if self.field('database_profile_select'):
+            profile_name = self.field('database_profile_name')
+        else:
+            profile_name = self.field('database_profile_new_name')
+        self.worker = DatabaseSetupWorker(profile=profiles.get(profile_name))
         self.worker.start()
         
         self.worker.stateProgress.connect(self.onStateProgressSignal)
@@ -298,6 +298,8 @@ class DatabaseSetupWizardPage(BaseWizardPage):
         
         for detailsLbl in self.stateDetails.itervalues():
             detailsLbl.setText("")
+        
+        self.exportBtn.setEnabled(False)
     
     def validatePage(self):
         if self.__error_occured:
@@ -324,6 +326,8 @@ class DatabaseSetupWizardPage(BaseWizardPage):
             message = "Error creating tables!"
         elif state == self.worker.STATE_TEST:
             message = "Error inserting test values!"
+        elif state == self.worker.STATE_DONE:
+            message = "Error creating indexes!"
         else:
             message = "An error occured!"
         
@@ -354,17 +358,28 @@ class DatabaseSetupWizardPage(BaseWizardPage):
                 self.setMessage(state, progress, "Loading models...")
             elif progress == self.worker.DONE:
                 self.setMessage(state, progress, "Models loaded.")
-                self.setPrompt(question="""Reconfigure Database?
-This will drop the tables in the database you chose and recreate it.""",
-                               onAccept=self.worker.STATE_CREATE,
-                               onReject=self.worker.STATE_DONE
-                               )
+                self.exportBtn.setEnabled(True)
+                checkpoint = self.worker.pipeline.checkpoint
+                if checkpoint is not None and checkpoint.resumable:
+                    self.setPrompt(question="""Resume the interrupted database setup?
+The tables were created and test values were inserted for {} modules.""".format(len(checkpoint.tested)),
+                                   onAccept=self.worker.STATE_CREATE,
+                                   onReject=self.promptReconfigure
+                                   )
+                else:
+                    self.promptReconfigure()
         elif state == self.worker.STATE_CREATE:
             # Third, create the tables
             if progress == self.worker.START:
                 self.setMessage(state, progress, "Creating tables...")
             elif progress == self.worker.DONE:
                 self.setMessage(state, progress, "Tables created.")
+                checkpoint = self.worker.pipeline.checkpoint
+                if checkpoint is not None and checkpoint.tested:
+                    # Inserting test values was interrupted, carry on
+                    self.worker.stateRun.emit(self.worker.STATE_TEST)
+                    self.completeChanged.emit()
+                    return
                 self.setPrompt(question="""Insert test values?""",
                                onAccept=self.worker.STATE_TEST,
                                onReject=self.worker.STATE_DONE
@@ -382,22 +397,50 @@ This will drop the tables in the database you chose and recreate it.""",
         
         self.completeChanged.emit()
     
+    def onExportButton(self):
+        filename, _ = QtGui.QFileDialog.getSaveFileName(self, 'Export Database Schema',
+                                                        'schema.sql', 'SQL script (*.sql)')
+        if not filename:
+            return
+        try:
+            schema.compile_schema().export(filename)
+        except Exception as e:
+            logger.exception("Could not export database schema")
+            QtGui.QMessageBox.warning(self, 'Export Database Schema',
+                "Could not export the schema:\n{}".format(e), QtGui.QMessageBox.Ok)
+        else:
+            QtGui.QMessageBox.information(self, 'Export Database Schema',
+                "Database schema exported to {}.".format(filename), QtGui.QMessageBox.Ok)
+    
+    def promptReconfigure(self):
+        if self.worker.pipeline.checkpoint is not None:
+            # Starting over, forget what the interrupted setup did
+            self.worker.pipeline.checkpoint.reset()
+        self.setPrompt(question="""Reconfigure Database?
+This will drop the tables in the database you chose and recreate it.""",
+                       onAccept=self.worker.STATE_CREATE,
+                       onReject=self.worker.STATE_DONE
+                       )
+    
     def setPrompt(self, question, onAccept, onReject):
         self.questionBox.show()
         self.prompt.setText(question)
         
-        self.__question_accept_callback = lambda sig=onAccept: self.worker.stateRun.emit(sig)
-        self.__question_reject_callback = lambda sig=onReject: self.worker.stateRun.emit(sig) 
+        # Answers are either the next state to run, or a callable
+        self.__question_accept_callback = onAccept if callable(onAccept) else lambda sig=onAccept: self.worker.stateRun.emit(sig)
+        self.__question_reject_callback = onReject if callable(onReject) else lambda sig=onReject: self.worker.stateRun.emit(sig)
     
     def onPromptAccept(self):
-        self.__question_accept_callback()
-        
+        # Hide first, the callback may ask another question
         self.questionBox.hide()
+        
+        self.__question_accept_callback()
     
     def onPromptReject(self):
-        self.__question_reject_callback()
-        
+        # Hide first, the callback may ask another question
         self.questionBox.hide()
+        
+        self.__question_reject_callback()
     
     def setMessage(self, state, stage, text):
         self.stateDetails[state].setText(text)
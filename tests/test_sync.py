@@ -0,0 +1,155 @@
+"""
+Config sync client against the reference config server.
+
+Needs a working Coinbox installation, run with:
+
+    python -m unittest discover tests
+"""
+import os
+import json
+import shutil
+import tempfile
+import threading
+import unittest
+
+import cbpos
+
+from cbmod.config.controllers import sync, writer
+from cbmod.config.controllers.syncserver import ConfigServer
+
+class MemoryConfig(object):
+    """
+    Stands in for cbpos.config, keeping the sections in memory.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.sections = {}
+        self.saves = 0
+
+    def __iter__(self):
+        return iter(sorted(self.sections.items()))
+
+    def __getitem__(self, key):
+        if isinstance(key, tuple):
+            section, option = key
+            return self.sections.get(section, {}).get(option)
+        return self.sections[key]
+
+    def __setitem__(self, key, value):
+        if isinstance(key, tuple):
+            section, option = key
+            if value is None:
+                self.sections.get(section, {}).pop(option, None)
+            else:
+                self.sections.setdefault(section, {})[option] = value
+        elif value is None:
+            self.sections.pop(key, None)
+
+    def save(self):
+        self.saves += 1
+
+class FlakyConfigServer(ConfigServer):
+    """
+    Answers 503 to the first `failures` requests.
+    """
+
+    failures = 0
+
+    def acquire(self):
+        if self.failures:
+            self.failures -= 1
+            return False
+        return ConfigServer.acquire(self)
+
+class SyncClientTest(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.root = os.path.join(self.workdir, 'root')
+        os.makedirs(os.path.join(self.root, 'default'))
+        os.makedirs(os.path.join(self.root, 'terminals', 'till1'))
+        self.write_section('default', 'mod.pos', {'currency': 'USD', 'receipt': 'short'})
+        self.write_section('default', 'mod.sales', {'tax': '0.1'})
+        self.write_section('terminals/till1', 'mod.printer', {'port': '/dev/lp0'})
+
+        self.config = MemoryConfig(os.path.join(self.workdir, 'coinbox.cfg'))
+        self.config.sections['mod.local'] = {'kept': 'yes'}
+        cbpos.config = self.config
+        writer._base = None
+
+        self.server = FlakyConfigServer(('127.0.0.1', 0), self.root, retry_after=0)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+        self.client = self.make_client()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.workdir)
+
+    def make_client(self, terminal='till1'):
+        client = sync.SyncClient('http://127.0.0.1:{}/'.format(self.server.server_address[1]),
+                                 terminal, retries=3, backoff=0.01)
+        self.requests = []
+        request = client.request
+
+        def recorded(path, etag=None):
+            data, etag = request(path, etag)
+            self.requests.append((path, data is not None))
+            return data, etag
+
+        client.request = recorded
+        return client
+
+    def write_section(self, directory, name, options):
+        with open(os.path.join(self.root, directory, name + '.json'), 'wb') as f:
+            f.write(json.dumps(options).encode('utf-8'))
+
+    def test_first_pull(self):
+        self.assertEqual(self.client.pull(), ['mod.pos', 'mod.printer', 'mod.sales'])
+        self.assertEqual(self.config['mod.pos', 'currency'], 'USD')
+        self.assertEqual(self.config['mod.printer', 'port'], '/dev/lp0')
+        self.assertEqual(self.config.saves, 1)
+
+    def test_not_modified(self):
+        self.client.pull()
+        del self.requests[:]
+        self.assertEqual(self.make_client().pull(), [])
+        # One conditional request for the index, answered 304
+        self.assertEqual(self.requests, [('index', False)])
+        self.assertEqual(self.config.saves, 1)
+
+    def test_delta_pull(self):
+        self.client.pull()
+        self.write_section('default', 'mod.pos', {'currency': 'EUR'})
+        os.remove(os.path.join(self.root, 'default', 'mod.sales.json'))
+
+        client = self.make_client()
+        self.assertEqual(client.pull(), ['mod.pos', 'mod.sales'])
+        # Only the changed section is requested
+        self.assertEqual(self.requests, [('index', True), ('sections?names=mod.pos', True)])
+        self.assertEqual(self.config['mod.pos', 'currency'], 'EUR')
+        # Dropped by the server, removed locally
+        self.assertEqual(self.config['mod.pos', 'receipt'], None)
+        self.assertNotIn('mod.sales', self.config.sections)
+        self.assertNotIn('mod.sales', client.state.sections)
+        # Never served, left alone
+        self.assertEqual(self.config['mod.local', 'kept'], 'yes')
+
+    def test_retry_after_503(self):
+        self.server.failures = 2
+        self.assertEqual(self.client.pull(), ['mod.pos', 'mod.printer', 'mod.sales'])
+        self.assertEqual(self.server.failures, 0)
+
+    def test_unavailable(self):
+        self.server.failures = 10
+        self.assertRaises(sync.SyncError, self.client.pull)
+
+    def test_terminal_outside_root(self):
+        self.assertRaises(sync.SyncError, self.make_client('../default').pull)
+
+if __name__ == '__main__':
+    unittest.main()